@@ -1,15 +1,181 @@
+import numpy as np
+
 import enums
-import pygame
+from input_manager import WASD_BINDINGS
+
+ACTOR_DIRECTIONS = list(enums.ActorDirections)
+TANK_ANIMATION_CYCLES = list(enums.TankAnimationCycle)
+
+NO_ROW = -1
+
+
+class ActorTable(object):
+    """
+    Struct-of-arrays storage of actors, bullets and animations.
+    Actor objects are lightweight views of table rows, so whole-array operations can update many of them at once.
+    Rows of removed actors are reused, views of removed actors must not be used.
+
+    Views removed with recycle() are kept in per-class pools and handed out again by acquire(), so short-lived
+    bullets and animations are not allocated on every shot. A pool never holds more views than the table has rows,
+    so after warm-up every view comes from the pool however many of them are live at peak.
+    """
+    COLUMNS = ('kind', 'x', 'y', 'direction', 'speed', 'step_cycle', 'step_counter', 'bullet', 'owner',
+               'sprite_counter', 'lifetime', 'is_dead')
+
+    def __init__(self, capacity=16):
+        self.capacity = 0
+        self.values = np.zeros((len(self.COLUMNS), 0), dtype=np.int32)
+        self.used = np.zeros(0, dtype=np.bool_)
+
+        self.objects = []
+        self._free_rows = []
+        self._pools = {}
+        self._grow(max(capacity, 1))
+
+    def _grow(self, capacity):
+        values = np.zeros((len(self.COLUMNS), capacity), dtype=np.int32)
+        values[:, :self.capacity] = self.values
+        self.values = values
+        # named columns are rows of values, views read a field with one lookup by its column index
+        for index, name in enumerate(self.COLUMNS):
+            setattr(self, name, values[index])
+
+        used = np.zeros(capacity, dtype=np.bool_)
+        used[:self.capacity] = self.used
+        self.used = used
+
+        self.objects.extend([None] * (capacity - self.capacity))
+        self._free_rows.extend(reversed(xrange(self.capacity, capacity)))
+        self.capacity = capacity
+
+    def allocate(self, obj, kind):
+        if not self._free_rows:
+            self._grow(self.capacity * 2)
+
+        row = self._free_rows.pop()
+        self.values[:, row] = 0
+        self.kind[row] = kind.value
+        self.bullet[row] = NO_ROW
+        self.owner[row] = NO_ROW
+        self.used[row] = True
+        self.objects[row] = obj
+        return row
+
+    def release(self, row):
+        self.used[row] = False
+        self.objects[row] = None
+        self._free_rows.append(row)
+
+    def recycle(self, row):
+        """
+        Releases row and keeps its view for reuse
+        """
+        obj = self.objects[row]
+        self.release(row)
+
+        pool = self._pools.setdefault(type(obj), [])
+        if len(pool) < self.capacity:
+            pool.append(obj)
+
+    def acquire(self, cls, *args, **kwargs):
+        """
+        Creates view of given class, recycled view is initialized in place if there is one.
+        Arguments have to place the view into this table.
+        """
+        pool = self._pools.get(cls)
+        if not pool:
+            return cls(*args, **kwargs)
+
+        obj = pool.pop()
+        obj.__init__(*args, **kwargs)
+        return obj
+
+    def adopt(self, obj):
+        """
+        Moves object (and tank's bullet) from its current table into this one
+        """
+        old_table, old_row = obj._table, obj._row
+        if old_table is self:
+            return
+
+        values = old_table.values[:, old_row].copy()
+        bullet_row = old_table.bullet.item(old_row)
+        bullet = old_table.objects[bullet_row] if bullet_row != NO_ROW else None
+        old_table.release(old_row)
+
+        row = self.allocate(obj, enums.ActorKinds(values.item(0)))
+        self.values[:, row] = values
+        obj._table, obj._row = self, row
+
+        if bullet is not None:
+            self.adopt(bullet)
+            self.bullet[row] = bullet._row
+            self.owner[bullet._row] = row
+
+    def rows_of(self, objects):
+        return np.fromiter((obj._row for obj in objects), dtype=np.intp, count=len(objects))
+
+    def animate_tank(self, row):
+        counter = (self.step_counter.item(row) + 1) % 3
+        self.step_counter[row] = counter
+        if counter == 0:
+            self.step_cycle[row] = 1 - self.step_cycle.item(row)
+
+    def tick_animation(self, row):
+        counter = self.sprite_counter.item(row) + 1
+        self.sprite_counter[row] = counter
+        self.is_dead[row] = counter >= self.lifetime.item(row)
+
+    def tick_animations(self, rows):
+        counter = self.sprite_counter[rows] + 1
+        self.sprite_counter[rows] = counter
+        self.is_dead[rows] = counter >= self.lifetime[rows]
+
+
+def _column(name):
+    index = ActorTable.COLUMNS.index(name)
+
+    def getter(self):
+        return self._table.values.item(index, self._row)
+
+    def setter(self, value):
+        self._table.values[index, self._row] = value
+
+    return property(getter, setter)
+
+
+def _enum_column(name, members):
+    index = ActorTable.COLUMNS.index(name)
+
+    def getter(self):
+        return members[self._table.values.item(index, self._row)]
+
+    def setter(self, value):
+        self._table.values[index, self._row] = value.value
+
+    return property(getter, setter)
 
 
 class Actor(object):
-    def __init__(self, x, y, sprite, direction, moving_speed=1):
+    __slots__ = ('_table', '_row', 'sprite')
+
+    KIND = enums.ActorKinds.TANK
+
+    def __init__(self, x, y, sprite, direction, moving_speed=1, table=None):
+        self._table = table if table is not None else ActorTable(1)
+        self._row = self._table.allocate(self, self.KIND)
+
         self.x = x
         self.y = y
         self.direction = direction
         self.sprite = sprite
         self.moving_speed = moving_speed
 
+    x = _column('x')
+    y = _column('y')
+    direction = _enum_column('direction', ACTOR_DIRECTIONS)
+    moving_speed = _column('speed')
+
     def animate(self):
         raise NotImplemented
 
@@ -18,76 +184,139 @@ class Actor(object):
 
 
 class TankActor(Actor):
-    def __init__(self, x, y, tank_sprite):
+    __slots__ = ('tank_sprite',)
+
+    def __init__(self, x, y, tank_sprite, table=None):
         assert tank_sprite in enums.TANK_SPRITES
 
-        super(TankActor, self).__init__(x, y, tank_sprite, enums.ActorDirections.UP)
+        super(TankActor, self).__init__(x, y, tank_sprite, enums.ActorDirections.UP, table=table)
         self.step_cycle = enums.TankAnimationCycle.FIRST
         self._step_counter = 0
         self.bullet = None
         self.tank_sprite = tank_sprite
 
+    step_cycle = _enum_column('step_cycle', TANK_ANIMATION_CYCLES)
+    _step_counter = _column('step_counter')
+
+    @property
+    def bullet(self):
+        row = self._table.bullet.item(self._row)
+        return self._table.objects[row] if row != NO_ROW else None
+
+    @bullet.setter
+    def bullet(self, bullet):
+        table = self._table
+        row = table.bullet.item(self._row)
+        if row != NO_ROW and (bullet is None or bullet._row != row):
+            table.recycle(row)
+
+        if bullet is None:
+            table.bullet[self._row] = NO_ROW
+        else:
+            table.adopt(bullet)
+            table.bullet[self._row] = bullet._row
+            table.owner[bullet._row] = self._row
+
     def get_action(self, game_state):
         pass
 
     def animate(self):
-        self._step_counter += 1
-        self._step_counter %= 3
-        if self._step_counter == 0:
-            if self.step_cycle == enums.TankAnimationCycle.FIRST:
-                self.step_cycle = enums.TankAnimationCycle.SECOND
-            else:
-                self.step_cycle = enums.TankAnimationCycle.FIRST
+        self._table.animate_tank(self._row)
 
     def remove_bullet(self):
         self.bullet = None
 
 
 class Bullet(Actor):
+    __slots__ = ('source_tank',)
+
+    KIND = enums.ActorKinds.BULLET
+
     def __init__(self, x, y, direction, source_tank):
-        super(Bullet, self).__init__(x, y, enums.ActorSpriteEnum.BULLET, direction, moving_speed=2)
-        self.x = x
-        self.y = y
-        self.direction = direction
+        super(Bullet, self).__init__(x, y, enums.ActorSpriteEnum.BULLET, direction, moving_speed=2,
+                                     table=source_tank._table)
         self.source_tank = source_tank
 
     def animate(self):
         pass
 
 
-class PyGameKeyboardPlayer(TankActor):
+class ExternalPlayer(TankActor):
     """
-    This player works only if pygame was initialized
+    Tank which repeats action set from outside of the game loop, e.g. by learning agent
     """
+    __slots__ = ('action',)
+
     def __init__(self, x, y, tank_sprite):
-        super(PyGameKeyboardPlayer, self).__init__(x, y, tank_sprite)
+        super(ExternalPlayer, self).__init__(x, y, tank_sprite)
+        self.action = enums.Actions.DO_NOTHING
 
-    def get_action(self, field):
-        pygame.event.get(pygame.KEYDOWN)  # code below does not work without this
+    def get_action(self, game_state):
+        return self.action
 
-        keys = pygame.key.get_pressed()
 
-        if keys[pygame.K_w]:
-            return enums.Actions.GO_UP
+class PolicyPlayer(ExternalPlayer):
+    """
+    Tank driven by batch policy. GameEngine calls every policy once per tick with all its tanks
+    and sets their actions before any tank acts.
+    """
+    __slots__ = ('policy',)
 
-        if keys[pygame.K_a]:
-            return enums.Actions.GO_LEFT
+    def __init__(self, x, y, tank_sprite, policy):
+        super(PolicyPlayer, self).__init__(x, y, tank_sprite)
+        self.policy = policy
 
-        if keys[pygame.K_s]:
-            return enums.Actions.GO_DOWN
 
-        if keys[pygame.K_d]:
-            return enums.Actions.GO_RIGHT
+class ScriptedPlayer(TankActor):
+    """
+    Tank which cycles through predefined list of actions
+    """
+    __slots__ = ('_actions', '_action_index')
 
-        if keys[pygame.K_SPACE]:
-            return enums.Actions.SHOOT
+    def __init__(self, x, y, tank_sprite, actions):
+        super(ScriptedPlayer, self).__init__(x, y, tank_sprite)
+        self._actions = list(actions)
+        self._action_index = 0
 
-        return enums.Actions.DO_NOTHING
+    def get_action(self, game_state):
+        action = self._actions[self._action_index]
+        self._action_index = (self._action_index + 1) % len(self._actions)
+        return action
+
+
+class PyGameKeyboardPlayer(TankActor):
+    """
+    Human player reading keys from shared InputManager, which has to be polled once per frame
+    """
+    __slots__ = ('_input', 'bindings')
+
+    def __init__(self, x, y, tank_sprite, input_manager, bindings=WASD_BINDINGS):
+        super(PyGameKeyboardPlayer, self).__init__(x, y, tank_sprite)
+        self._input = input_manager
+        self.bindings = bindings
+
+    def get_action(self, field):
+        return self._input.get_action(self.bindings)
+
+
+_sprite_lists = {}
+
+
+def _get_sprite_list(sprite_enum):
+    sprites = _sprite_lists.get(sprite_enum)
+    if sprites is None:
+        sprites = _sprite_lists[sprite_enum] = list(sprite_enum)
+    return sprites
 
 
 class Animation(object):
-    def __init__(self, sprite_enum, x, y, sprite_size):
-        self._sprites = list(sprite_enum)
+    __slots__ = ('_table', '_row', '_sprites', 'sprite_size', '_delay')
+
+    def __init__(self, sprite_enum, x, y, sprite_size, table=None):
+        self._table = table if table is not None else ActorTable(1)
+        self._row = self._table.allocate(self, enums.ActorKinds.ANIMATION)
+
+        self._sprites = _get_sprite_list(sprite_enum)
         self._sprite_counter = 0
         self.x = x
         self.y = y
@@ -95,11 +324,22 @@ class Animation(object):
         self.is_dead = False
 
         self._delay = 3
+        self._table.lifetime[self._row] = len(self._sprites) * self._delay
+
+    x = _column('x')
+    y = _column('y')
+    _sprite_counter = _column('sprite_counter')
+
+    @property
+    def is_dead(self):
+        return bool(self._table.is_dead.item(self._row))
+
+    @is_dead.setter
+    def is_dead(self, value):
+        self._table.is_dead[self._row] = value
 
     def tick(self):
-        self._sprite_counter += 1
-        if self._sprite_counter / self._delay == len(self._sprites):
-            self.is_dead = True
+        self._table.tick_animation(self._row)
 
     @property
     def sprite(self):
@@ -112,7 +352,13 @@ class Animation(object):
 
 class AnimationFactory(object):
     @staticmethod
-    def make_bullet_explosion_animation(bullet):
-        shift = enums.BULLET_EXPLOSION_SHIFT[bullet.direction.value]
-        x, y = bullet.x + shift[0], bullet.y + shift[1]
-        return Animation(enums.ShotAnimationSprites, x, y, enums.BULLET_EXPLOSION_ANIMATION_RECT)
\ No newline at end of file
+    def make_bullet_explosion_animations(table, rows):
+        """
+        Explosions of bullets in given table rows, animation views are taken from the table pool
+        """
+        direction = table.direction[rows]
+        x = table.x[rows] + enums.EXPLOSION_SHIFT_X[direction]
+        y = table.y[rows] + enums.EXPLOSION_SHIFT_Y[direction]
+        return [table.acquire(Animation, enums.ShotAnimationSprites, x, y, enums.BULLET_EXPLOSION_ANIMATION_RECT,
+                              table=table)
+                for x, y in zip(x.tolist(), y.tolist())]
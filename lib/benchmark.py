@@ -0,0 +1,205 @@
+"""
+Headless throughput benchmarks for engine and renderer.
+
+Usage: python benchmark.py [--output results.json] [--ticks 500] [--quick]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+import enums
+from actors import ScriptedPlayer
+from environment import make_random_map
+from game import GameState, GameEngine, Renderer, NumpyScreen, SPRITE_FILE
+from sprites import SpriteStorage
+
+SPAWN_GRID = 16
+MOVE_ACTIONS = [enums.Actions.GO_UP, enums.Actions.GO_LEFT, enums.Actions.GO_DOWN, enums.Actions.GO_RIGHT]
+
+
+def make_script(random_state, length, shooting):
+    """
+    Random walk with long straight runs. Shooting tanks fire every other tick.
+    """
+    actions = []
+    while len(actions) < length:
+        move = MOVE_ACTIONS[random_state.randint(len(MOVE_ACTIONS))]
+        for _ in xrange(random_state.randint(4, 16)):
+            actions.append(move)
+            if shooting:
+                actions.append(enums.Actions.SHOOT)
+    return actions[:length]
+
+
+def make_game_state(actor_count, bullet_count, density, seed=0):
+    random_state = np.random.RandomState(seed)
+    map = make_random_map(random_state, brick_density=density * 0.8, concrete_density=density * 0.2)
+
+    spawn_cells = GameState.BOARD_SIZE / SPAWN_GRID
+    spawns = random_state.permutation(spawn_cells * spawn_cells)[:actor_count]
+
+    actors = []
+    for i, spawn in enumerate(spawns):
+        x, y = (spawn % spawn_cells) * SPAWN_GRID, (spawn / spawn_cells) * SPAWN_GRID
+        map[y / 4: (y + SPAWN_GRID) / 4, x / 4: (x + SPAWN_GRID) / 4] = 0
+
+        script = make_script(random_state, 256, shooting=i < bullet_count)
+        actors.append(ScriptedPlayer(x, y, enums.ActorSpriteEnum.PLAYER_1_TANK, script))
+
+    game_state = GameState(map)
+    for actor in actors:
+        game_state.add_actor(actor)
+    return game_state
+
+
+def measure(function, calls):
+    latencies = np.empty(calls)
+    timer = timeit.default_timer
+    for i in xrange(calls):
+        start = timer()
+        function()
+        latencies[i] = timer() - start
+
+    total = latencies.sum()
+    return {
+        'calls': calls,
+        'total_s': total,
+        'per_sec': calls / total if total > 0 else float('inf'),
+        'latency_us': {
+            'mean': latencies.mean() * 1e6,
+            'p50': np.percentile(latencies, 50) * 1e6,
+            'p90': np.percentile(latencies, 90) * 1e6,
+            'p99': np.percentile(latencies, 99) * 1e6,
+            'max': latencies.max() * 1e6,
+        }
+    }
+
+
+def bench_tick(params, calls):
+    game_state = make_game_state(params['actors'], params['bullets'], params['density'])
+    engine = GameEngine(game_state)
+    return measure(engine.tick, calls)
+
+
+def bench_render(params, calls):
+    game_state = make_game_state(params['actors'], params['bullets'], params['density'])
+    engine = GameEngine(game_state)
+    renderer = Renderer(game_state, NumpyScreen(), params['scale'])
+    engine.set_renderer(renderer)
+
+    def frame():
+        engine.tick()
+        renderer.render()
+
+    return {
+        'tick_and_render': measure(frame, calls),
+        'render': measure(renderer.render, calls),
+    }
+
+
+def bench_render_env(params, calls):
+    game_state = make_game_state(0, 0, params['density'])
+    renderer = Renderer(game_state, NumpyScreen(), params['scale'])
+    return measure(renderer._render_env, calls)
+
+
+def bench_update_bg(params, calls):
+    game_state = make_game_state(0, 0, params['density'])
+    renderer = Renderer(game_state, NumpyScreen(), params['scale'])
+
+    random_state = np.random.RandomState(0)
+    cells = GameState.BOARD_SIZE / 4
+    rects = [(random_state.randint(cells), random_state.randint(cells), 6, 6) for _ in xrange(calls)]
+    rects = iter(rects)
+    return measure(lambda: renderer.update_bg(next(rects)), calls)
+
+
+def bench_sprite_loading(params, calls):
+    if not params['atlas']:
+        return measure(lambda: SpriteStorage(SPRITE_FILE, params['scale']), calls)
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        SpriteStorage(SPRITE_FILE, params['scale'], cache_dir=cache_dir)
+        return measure(lambda: SpriteStorage(SPRITE_FILE, params['scale'], cache_dir=cache_dir), calls)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def sweep(**axes):
+    names = sorted(axes)
+    for values in itertools.product(*(axes[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(ticks, quick=False):
+    actor_counts = [1, 10] if quick else [1, 10, 50]
+    densities = [0.0, 0.3] if quick else [0.0, 0.3, 0.6]
+    scales = [1] if quick else [1, 4]
+
+    results = []
+
+    def record(name, params, result):
+        results.append({'benchmark': name, 'params': params, 'result': result})
+        sys.stderr.write('%s %s\n' % (name, json.dumps(params, sort_keys=True)))
+
+    for params in sweep(actors=actor_counts, density=densities, bullets=['none', 'all']):
+        params['bullets'] = 0 if params['bullets'] == 'none' else params['actors']
+        record('engine_tick', params, bench_tick(params, ticks))
+
+    for params in sweep(actors=actor_counts, density=densities, scale=scales):
+        params['bullets'] = params['actors']
+        record('renderer_render', params, bench_render(params, ticks))
+
+    for params in sweep(density=densities, scale=scales):
+        record('renderer_render_env', params, bench_render_env(params, max(ticks / 50, 3)))
+        record('renderer_update_bg', params, bench_update_bg(params, ticks))
+
+    for params in sweep(scale=scales, atlas=[False, True]):
+        record('sprite_storage_load', params, bench_sprite_loading(params, max(ticks / 100, 3)))
+
+    return {
+        'meta': {
+            'timestamp': time.time(),
+            'commit': get_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'ticks': ticks,
+        },
+        'results': results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Engine and renderer throughput benchmarks')
+    parser.add_argument('--output', help='JSON file to write results to, stdout by default')
+    parser.add_argument('--ticks', type=int, default=500, help='calls per measured benchmark')
+    parser.add_argument('--quick', action='store_true', help='smaller parameter sweep')
+    args = parser.parse_args()
+
+    report = run(args.ticks, args.quick)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
@@ -1,5 +1,10 @@
 from enum import Enum
 
+import numpy as np
+
+# map cell size in pixels
+CELL_SIZE = 4
+
 
 class ActorSpriteEnum(Enum):
     PLAYER_1_TANK = 0
@@ -13,6 +18,12 @@ TANK_SPRITES = {
 }
 
 
+class ActorKinds(Enum):
+    TANK = 0
+    BULLET = 1
+    ANIMATION = 2
+
+
 class StaticObjectTypes(Enum):
     BRICK = 0
     CONCRETE = 1
@@ -37,6 +48,13 @@ class ActorDirections(Enum):
     RIGHT = 3
 
 
+# plain values for comparisons with table columns and arrays
+DIRECTION_UP = ActorDirections.UP.value
+DIRECTION_LEFT = ActorDirections.LEFT.value
+DIRECTION_DOWN = ActorDirections.DOWN.value
+ACTION_SHOOT = Actions.SHOOT.value
+
+
 class ShotAnimationSprites(Enum):
     FIRST_FRAME = 0
     SECOND_FRAME = 1
@@ -51,6 +69,10 @@ DIRECTION_VECTORS = [
     (1, 0)      # RIGHT
 ]
 
+# tables indexed by arrays of direction values
+DIRECTION_DX = np.array([v[0] for v in DIRECTION_VECTORS], dtype=np.int32)
+DIRECTION_DY = np.array([v[1] for v in DIRECTION_VECTORS], dtype=np.int32)
+
 
 BULLET_COLLISION_RECTANGLES = [
     (0, 0, 3, 4),
@@ -59,6 +81,9 @@ BULLET_COLLISION_RECTANGLES = [
     (0, 0, 4, 3),
 ]
 
+BULLET_RECT_DX = np.array([r[2] for r in BULLET_COLLISION_RECTANGLES], dtype=np.int32)
+BULLET_RECT_DY = np.array([r[3] for r in BULLET_COLLISION_RECTANGLES], dtype=np.int32)
+
 BULLET_SPRITE_RECTS = [
     (3, 6, 3, 4),
     (2, 6, 4, 3),
@@ -73,6 +98,9 @@ BULLET_TANK_SHIFTS = [
     (15, 6),
 ]
 
+BULLET_SHIFT_X = np.array([s[0] for s in BULLET_TANK_SHIFTS], dtype=np.int32)
+BULLET_SHIFT_Y = np.array([s[1] for s in BULLET_TANK_SHIFTS], dtype=np.int32)
+
 BULLET_EXPLOSION_SHIFT = [
     (-7, -8),
     (-8, -7),
@@ -80,9 +108,24 @@ BULLET_EXPLOSION_SHIFT = [
     (-4, -7),
 ]
 
+EXPLOSION_SHIFT_X = np.array([s[0] for s in BULLET_EXPLOSION_SHIFT], dtype=np.int32)
+EXPLOSION_SHIFT_Y = np.array([s[1] for s in BULLET_EXPLOSION_SHIFT], dtype=np.int32)
+
 TANK_COLLISION_RECTANGLE = (0, 0, 16, 16)
 
 
+class ObservationChannels(Enum):
+    BRICK = 0
+    CONCRETE = 1
+    TANK_UP = 2
+    TANK_LEFT = 3
+    TANK_DOWN = 4
+    TANK_RIGHT = 5
+    BULLET = 6
+    EXPLOSION = 7
+    FOCUS_TANK = 8
+
+
 class TankAnimationCycle(Enum):
     FIRST = 0
     SECOND = 1
@@ -0,0 +1,452 @@
+"""
+Local server which hosts many TankEnvironments for several clients.
+
+Clients talk to the server over a UNIX domain socket with length-prefixed JSON messages. Environments run in
+worker processes, which render observations straight into a memory-mapped file shared with clients, so only
+actions, rewards and small info dicts go through the socket. Requests which arrive within batch_window of each
+other are executed as one batch, spread over all workers.
+
+Usage: python env_server.py --socket /tmp/tanks.sock [--workers 4] [--max-envs 64] [--scale 1]
+"""
+import argparse
+import errno
+import json
+import multiprocessing
+import os
+import select
+import shutil
+import signal
+import socket
+import stat
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+import enums
+from environment import TankEnvironment
+from game import NumpyScreen, Renderer
+
+HEADER = struct.Struct('!I')
+MAX_MESSAGE_SIZE = 1 << 20
+SHARED_MEMORY_DIR = '/dev/shm'
+
+ACTION_VALUES = frozenset(action.value for action in enums.Actions)
+MAX_SEED = 2 ** 32
+
+
+def send_message(sock, message):
+    data = json.dumps(message)
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def recv_message(sock):
+    size, = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    return json.loads(_recv_exactly(sock, size))
+
+
+def _open_observations(path, shape, mode):
+    return np.memmap(path, dtype=np.uint8, mode=mode, shape=tuple(shape))
+
+
+def _remove_stale_socket(path):
+    """
+    Unlinks socket file left behind by a killed server, socket of a running server is kept
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+    except OSError:
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as error:
+        if error.errno == errno.ECONNREFUSED:
+            os.unlink(path)
+    finally:
+        probe.close()
+
+
+def _worker(connection, inherited, observations_path, shape, env_kwargs):
+    # server ends of pipes are closed in the worker, so it sees EOF when the server dies,
+    # and so is the listening socket, so it is not kept open by workers of a killed server
+    for inherited_object in inherited:
+        inherited_object.close()
+
+    observations = _open_observations(observations_path, shape, 'r+')
+    envs = {}
+
+    while True:
+        try:
+            command, data = connection.recv()
+        except EOFError:
+            break
+
+        if command == 'batch':
+            # results are (error, value) pairs, failed operation must not stop the worker for other clients
+            results = []
+            for op, slot, argument in data:
+                try:
+                    if op == 'reset':
+                        env = envs.get(slot)
+                        if env is None:
+                            env = envs[slot] = TankEnvironment(screen=NumpyScreen(buffer=observations[slot]),
+                                                               **env_kwargs)
+                        env.reset(argument)
+                        results.append((None, None))
+
+                    elif op == 'step':
+                        _, reward, done, info = envs[slot].step(argument)
+                        results.append((None, (float(reward), bool(done), info)))
+
+                except Exception as error:
+                    results.append(('%s: %s' % (type(error).__name__, error), None))
+
+            connection.send(results)
+
+    # EOF comes only when the server closed or died, a killed server can not remove observations itself
+    shutil.rmtree(os.path.dirname(observations_path), ignore_errors=True)
+
+
+class _Client(object):
+    __slots__ = ('sock', 'buffer', 'envs')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = ''
+        self.envs = set()
+
+    def read_messages(self):
+        """
+        Reads available data, returns complete messages and None if connection was closed.
+        Raises ValueError on malformed or oversized message.
+        """
+        data = self.sock.recv(65536)
+        if not data:
+            return None
+
+        self.buffer += data
+        messages = []
+        while len(self.buffer) >= HEADER.size:
+            size, = HEADER.unpack_from(self.buffer)
+            if size > MAX_MESSAGE_SIZE:
+                raise ValueError('Message of %d bytes is too long' % size)
+            if len(self.buffer) < HEADER.size + size:
+                break
+            messages.append(json.loads(self.buffer[HEADER.size: HEADER.size + size]))
+            self.buffer = self.buffer[HEADER.size + size:]
+        return messages
+
+
+class EnvServer(object):
+    """
+    Environment slot i is served by worker i % num_workers. Environment objects are kept by workers when
+    clients close them, so reused slots do not load sprites again.
+    """
+    def __init__(self, socket_path, num_workers=None, max_envs=64, batch_window=0.001, **env_kwargs):
+        assert env_kwargs.get('observation_type', 'pixels') == 'pixels'
+        assert not set(env_kwargs) & {'frame_stack', 'downsample', 'grayscale', 'screen'}
+
+        self.socket_path = socket_path
+        self.batch_window = batch_window
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+
+        size = Renderer.get_screen_size(env_kwargs.get('scale', 1))
+        self.observations_shape = (max_envs, size, size)
+
+        self._clients = {}
+        self._running = False
+        self._free_slots = list(reversed(xrange(max_envs)))
+        self._connections = []
+        self._workers = []
+        self._shared_dir = None
+
+        # listener is bound first, so a server which can not get its socket does not start workers
+        _remove_stale_socket(socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._listener.bind(socket_path)
+        except socket.error:
+            self._listener.close()
+            raise
+
+        try:
+            self._listener.listen(64)
+
+            shared_dir = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None
+            self._shared_dir = tempfile.mkdtemp(prefix='tank-env-server-', dir=shared_dir)
+            self.observations_path = os.path.join(self._shared_dir, 'observations')
+            _open_observations(self.observations_path, self.observations_shape, 'w+').flush()
+
+            for _ in xrange(self.num_workers):
+                parent_connection, child_connection = multiprocessing.Pipe()
+                inherited = self._connections + [parent_connection, self._listener]
+                worker = multiprocessing.Process(target=_worker,
+                                                 args=(child_connection, inherited, self.observations_path,
+                                                       self.observations_shape, env_kwargs))
+                worker.daemon = True
+                self._connections.append(parent_connection)
+                worker.start()
+                child_connection.close()
+                self._workers.append(worker)
+        except BaseException:
+            self.close()
+            raise
+
+    def serve_forever(self, poll_interval=0.1):
+        self._running = True
+        while self._running:
+            self.serve_once(poll_interval)
+
+    def stop(self):
+        self._running = False
+
+    def _poll(self, timeout, requests):
+        """
+        Accepts new clients and collects their complete requests
+        """
+        sockets = [self._listener] + list(self._clients)
+        try:
+            readable, _, _ = select.select(sockets, [], [], timeout)
+        except select.error as error:
+            if error.args[0] == errno.EINTR:
+                return
+            raise
+
+        for sock in readable:
+            if sock is self._listener:
+                client_sock, _ = self._listener.accept()
+                self._clients[client_sock] = _Client(client_sock)
+                continue
+
+            client = self._clients[sock]
+            try:
+                messages = client.read_messages()
+            except (socket.error, ValueError):
+                # client which does not speak the protocol is dropped, the others are still served
+                messages = None
+
+            if messages is None:
+                self._disconnect(client)
+            else:
+                requests.extend((client, message) for message in messages)
+
+    def serve_once(self, timeout):
+        """
+        Waits for requests, gathers the ones arriving within batch window and executes them as one batch
+        """
+        requests = []
+        self._poll(timeout, requests)
+        if not requests:
+            return
+
+        deadline = time.time() + self.batch_window
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self._poll(remaining, requests)
+
+        self._execute(requests)
+
+    def _release(self, client, envs):
+        envs = set(envs)
+        client.envs.difference_update(envs)
+        self._free_slots.extend(envs)
+
+    def _disconnect(self, client):
+        del self._clients[client.sock]
+        self._release(client, list(client.envs))
+        client.sock.close()
+
+    def _execute(self, requests):
+        batches = [[] for _ in self._connections]
+        replies = []
+
+        for client, message in requests:
+            try:
+                reply, ops = self._plan(client, message)
+            except (KeyError, ValueError, TypeError) as error:
+                reply, ops = {'error': '%s: %s' % (type(error).__name__, error)}, []
+
+            positions = []
+            for op, slot, argument in ops:
+                batch = batches[slot % self.num_workers]
+                positions.append((slot % self.num_workers, len(batch)))
+                batch.append((op, slot, argument))
+            replies.append((client, reply, positions))
+
+        results = [None] * len(batches)
+        for worker, batch in enumerate(batches):
+            if batch:
+                self._connections[worker].send(('batch', batch))
+        for worker, batch in enumerate(batches):
+            if batch:
+                results[worker] = self._connections[worker].recv()
+
+        for client, reply, positions in replies:
+            op_results = [results[worker][index] for worker, index in positions]
+            errors = [error for error, _ in op_results if error is not None]
+            if errors:
+                # client does not learn ids of environments which failed to be created
+                self._release(client, reply.get('envs', []))
+                reply = {'error': errors[0]}
+            elif reply.pop('step', False):
+                reply['rewards'] = [reward for _, (reward, _, _) in op_results]
+                reply['dones'] = [done for _, (_, done, _) in op_results]
+                reply['infos'] = [info for _, (_, _, info) in op_results]
+
+            if client.sock in self._clients:
+                try:
+                    send_message(client.sock, reply)
+                except socket.error:
+                    self._disconnect(client)
+
+    def _check_envs(self, client, envs):
+        if not isinstance(envs, list):
+            raise TypeError('Environments have to be a list')
+        for env in envs:
+            if type(env) not in (int, long) or env not in client.envs:
+                raise KeyError('Environment %r does not belong to client' % (env,))
+        return envs
+
+    def _check_values(self, values, count, name, is_valid):
+        if not isinstance(values, list) or len(values) != count:
+            raise ValueError('Expected list of %d %s' % (count, name))
+        for value in values:
+            if not is_valid(value):
+                raise ValueError('Invalid %s %r' % (name[:-1], value))
+        return values
+
+    def _plan(self, client, message):
+        """
+        Returns reply skeleton and worker operations for request. Request is validated here,
+        so errors in it are reported to its client and never reach workers.
+        """
+        if not isinstance(message, dict):
+            raise TypeError('Request has to be an object')
+        op = message['op']
+
+        if op == 'create':
+            count = message.get('count', 1)
+            if type(count) not in (int, long) or count < 1:
+                raise ValueError('Invalid count %r' % (count,))
+            if count > len(self._free_slots):
+                raise ValueError('Only %d environments are available' % len(self._free_slots))
+
+            envs = [self._free_slots.pop() for _ in xrange(count)]
+            client.envs.update(envs)
+            reply = {'envs': envs, 'observations': self.observations_path, 'shape': self.observations_shape}
+            # new environments are reset, so they never show previous client's game
+            return reply, [('reset', env, None) for env in envs]
+
+        if op == 'reset':
+            envs = self._check_envs(client, message['envs'])
+            seeds = message.get('seeds') or [None] * len(envs)
+            self._check_values(seeds, len(envs), 'seeds',
+                               lambda seed: seed is None or (type(seed) in (int, long) and 0 <= seed < MAX_SEED))
+            return {}, [('reset', env, seed) for env, seed in zip(envs, seeds)]
+
+        if op == 'step':
+            envs = self._check_envs(client, message['envs'])
+            actions = self._check_values(message['actions'], len(envs), 'actions',
+                                         lambda action: type(action) in (int, long) and action in ACTION_VALUES)
+            return {'step': True}, [('step', env, action) for env, action in zip(envs, actions)]
+
+        if op == 'close':
+            self._release(client, self._check_envs(client, message['envs']))
+            return {}, []
+
+        raise ValueError('Unknown operation %s' % op)
+
+    def close(self):
+        for client in self._clients.values():
+            client.sock.close()
+        self._clients = {}
+        self._listener.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        # workers exit when their pipe is closed
+        for connection in self._connections:
+            connection.close()
+        for worker in self._workers:
+            worker.join()
+
+        if self._shared_dir is not None:
+            shutil.rmtree(self._shared_dir, ignore_errors=True)
+
+
+class EnvClient(object):
+    """
+    Client of EnvServer. Returned observations are read-only views of shared memory,
+    they are overwritten by the next reset or step of the same environment.
+    """
+    def __init__(self, socket_path):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+        self._observations = None
+
+    def _request(self, message):
+        send_message(self._sock, message)
+        reply = recv_message(self._sock)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply
+
+    def create(self, count=1):
+        reply = self._request({'op': 'create', 'count': count})
+        if self._observations is None:
+            self._observations = _open_observations(reply['observations'], reply['shape'], 'r')
+        return reply['envs']
+
+    def reset(self, envs, seeds=None):
+        self._request({'op': 'reset', 'envs': list(envs), 'seeds': seeds})
+        return [self._observations[env] for env in envs]
+
+    def step(self, envs, actions):
+        actions = [getattr(action, 'value', action) for action in actions]
+        reply = self._request({'op': 'step', 'envs': list(envs), 'actions': [int(action) for action in actions]})
+        observations = [self._observations[env] for env in envs]
+        return observations, np.array(reply['rewards']), np.array(reply['dones']), reply['infos']
+
+    def close_envs(self, envs):
+        self._request({'op': 'close', 'envs': list(envs)})
+
+    def close(self):
+        self._sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serves tank environments over UNIX domain socket')
+    parser.add_argument('--socket', required=True, help='path of the socket to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, CPU count by default')
+    parser.add_argument('--max-envs', type=int, default=64, help='number of environment slots')
+    parser.add_argument('--scale', type=int, default=1, help='observation scale')
+    parser.add_argument('--frame-skip', type=int, default=4)
+    parser.add_argument('--max-steps', type=int, default=1000)
+    args = parser.parse_args()
+
+    server = EnvServer(args.socket, num_workers=args.workers, max_envs=args.max_envs, scale=args.scale,
+                       frame_skip=args.frame_skip, max_steps=args.max_steps)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,145 @@
+import numpy as np
+
+import enums
+from actors import ExternalPlayer
+from game import GameState, GameEngine, MapBuilder, Renderer, NumpyScreen, BLOCK_COUNT, STATIC_OBJ_PER_BLOCK, \
+    static_object_mask
+from observations import TileObservationBuilder, FrameStack
+
+PLAYER_SPAWN = (0, 192)
+STATIC_OBJ_SIZE = 8
+
+
+def make_random_map(random_state, brick_density=0.3, concrete_density=0.05):
+    """
+    Fills static object slots with bricks and concrete at random, keeping player spawn free
+    """
+    map_builder = MapBuilder()
+    size = BLOCK_COUNT * STATIC_OBJ_PER_BLOCK
+
+    spawn_x, spawn_y = PLAYER_SPAWN[0] / STATIC_OBJ_SIZE, PLAYER_SPAWN[1] / STATIC_OBJ_SIZE
+    rolls = random_state.rand(size, size)
+
+    for y in xrange(size):
+        for x in xrange(size):
+            if spawn_x <= x < spawn_x + 2 and spawn_y <= y < spawn_y + 2:
+                continue
+
+            if rolls[y, x] < brick_density:
+                map_builder.add_bricks(x, y)
+            elif rolls[y, x] < brick_density + concrete_density:
+                map_builder.add_concrete(x, y)
+
+    return map_builder.get_map()
+
+
+def count_bricks(map):
+    return np.count_nonzero(static_object_mask(map, enums.StaticObjectTypes.BRICK))
+
+
+class TankEnvironment(object):
+    """
+    Single player environment with gym-like reset/step interface.
+
+    Each step repeats the action for frame_skip engine ticks and renders only the last one.
+    Reward is the number of brick cells destroyed during the step.
+
+    With 'pixels' observation type observation is the palette-index screen buffer, it is updated
+    in place on every step. With 'tiles' it is TileObservationBuilder tensor and nothing is rendered.
+
+    With frame_stack, downsample or grayscale observations go through FrameStack and observation is
+    the stack of the last frame_stack frames, downsample and grayscale apply to pixels only.
+    """
+    OBSERVATION_TYPES = ('pixels', 'tiles')
+
+    def __init__(self, frame_skip=4, max_steps=1000, scale=1, screen=None, map_factory=make_random_map,
+                 observation_type='pixels', frame_stack=1, downsample=1, grayscale=False):
+        assert frame_skip >= 1
+        assert observation_type in self.OBSERVATION_TYPES
+        assert observation_type == 'pixels' or (downsample == 1 and not grayscale)
+
+        self.observation_type = observation_type
+        self._tile_builder = TileObservationBuilder(MapBuilder.MAP_SIZE) if observation_type == 'tiles' else None
+
+        self._frame_stack = None
+        self._stack_args = None
+        if frame_stack > 1 or downsample > 1 or grayscale:
+            self._stack_args = (frame_stack, downsample, grayscale)
+
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+
+        self._scale = scale
+        self._screen = screen if screen is not None else NumpyScreen()
+        self._map_factory = map_factory
+        self._renderer = None
+
+        self.game_state = None
+        self.player = None
+        self._engine = None
+        self._steps = 0
+        self._bricks = 0
+
+    def reset(self, seed=None):
+        random_state = np.random.RandomState(seed)
+
+        self.player = ExternalPlayer(PLAYER_SPAWN[0], PLAYER_SPAWN[1], enums.ActorSpriteEnum.PLAYER_1_TANK)
+        self.game_state = GameState(self._map_factory(random_state)).add_actor(self.player)
+
+        self._engine = GameEngine(self.game_state)
+
+        if self._tile_builder is None:
+            if self._renderer is None:
+                self._renderer = Renderer(self.game_state, self._screen, self._scale)
+            else:
+                self._renderer.set_game_state(self.game_state)
+            self._engine.set_renderer(self._renderer)
+
+        if self._stack_args is not None:
+            self._reset_frame_stack()
+
+        self._steps = 0
+        self._bricks = count_bricks(self.game_state.map)
+        return self._observe()
+
+    def _reset_frame_stack(self):
+        if self._frame_stack is None:
+            depth, downsample, grayscale = self._stack_args
+            if self._tile_builder is not None:
+                frame_shape = self._tile_builder.shape
+            else:
+                frame_shape = self._screen.observation.shape
+
+            palette = self._screen.palette if grayscale else None
+            self._frame_stack = FrameStack(depth, frame_shape, downsample=downsample, palette=palette)
+
+        self._frame_stack.reset()
+
+    def step(self, action):
+        self.player.action = enums.Actions(action)
+
+        for _ in xrange(self.frame_skip):
+            self._engine.tick()
+        self._steps += 1
+
+        bricks = count_bricks(self.game_state.map)
+        reward = self._bricks - bricks
+        self._bricks = bricks
+
+        done = self._steps >= self.max_steps or bricks == 0
+        info = {
+            'ticks': self._steps * self.frame_skip,
+            'bricks_left': bricks
+        }
+        return self._observe(), reward, done, info
+
+    def _observe(self):
+        if self._tile_builder is not None:
+            observation = self._tile_builder.build(self.game_state, focus_actor=self.player)
+        else:
+            self._renderer.render()
+            observation = self._screen.observation
+
+        if self._frame_stack is not None:
+            return self._frame_stack.push(observation)
+        return observation
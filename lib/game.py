@@ -1,9 +1,15 @@
+import os
+
 import numpy as np
 from sprites import SpriteStorage
-from actors import PyGameKeyboardPlayer, Bullet, AnimationFactory
+from actors import PyGameKeyboardPlayer, PolicyPlayer, Bullet, Animation, AnimationFactory, ActorTable, \
+    ACTOR_DIRECTIONS, NO_ROW
 import pygame
 
 import enums
+from profiling import PhaseProfiler, InstrumentedProxy
+from game_loop import GameLoop
+from input_manager import InputManager, ARROW_BINDINGS
 
 BLOCK_COUNT = 13
 
@@ -14,6 +20,10 @@ PIXELS_PER_BLOCK = 16
 
 STATIC_SPRITE_TYPE_COUNT = 4
 
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+SPRITE_FILE = os.path.join(DATA_DIR, 'tank_sprite.png')
+SPRITE_CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+
 
 class MapBuilder(object):
     MAP_SIZE = BLOCK_COUNT * STATIC_OBJ_PER_BLOCK * SPRITES_PER_OBJ
@@ -44,25 +54,201 @@ class MapBuilder(object):
         return self._map.copy()
 
 
-def brick_collision(x, y, direction, game_state):
-    phase = (game_state.map[y, x] - 1) % 4
-    game_state.map[y, x] = 0
+def static_object_mask(map, object_type):
+    """
+    Returns mask of map cells which hold parts of static objects of given enums.StaticObjectTypes
+    """
+    base = object_type.value * STATIC_SPRITE_TYPE_COUNT
+    return (map > base) & (map <= base + STATIC_SPRITE_TYPE_COUNT)
+
 
-    if direction == enums.ActorDirections.UP or direction == enums.ActorDirections.DOWN:
-        if phase == 3 or phase == 1:
-            game_state.map[y, x - 1] = 0
+class CollisionIndex(object):
+    """
+    Integral image of occupied map cells. Emptiness of any cell rectangle is checked with four lookups.
+    """
+    # up to this many cleared cells slice updates are cheaper than one cumulative sum
+    SLICE_UPDATE_LIMIT = 4
+
+    def __init__(self, map):
+        self._map = map
+        self._integral = np.zeros((map.shape[0] + 1, map.shape[1] + 1), dtype=np.int32)
+        self.rebuild()
 
-        if phase == 2 or phase == 0:
-            game_state.map[y, x + 1] = 0
-    else:
-        if phase == 2 or phase == 3:
-            game_state.map[y - 1, x] = 0
+    def rebuild(self):
+        np.cumsum(np.cumsum(self._map != 0, axis=0), axis=1, out=self._integral[1:, 1:])
 
-        if phase == 1 or phase == 0:
-            game_state.map[y + 1, x] = 0
+    def count(self, x_min, y_min, x_max, y_max):
+        """
+        Counts occupied cells of rectangles given by coordinate arrays
+        """
+        integral = self._integral
+        return (integral[y_max, x_max] - integral[y_min, x_max]
+                - integral[y_max, x_min] + integral[y_min, x_min])
 
+    def is_free(self, x_min, y_min, x_max, y_max):
+        """
+        Checks one rectangle given by python numbers, lookups return python ints which are cheaper to add
+        """
+        item = self._integral.item
+        return item(y_max, x_max) - item(y_min, x_max) - item(y_max, x_min) + item(y_min, x_min) == 0
 
-def concrete_collision(x, y, direction, game_state):
+    def cells_cleared(self, x, y):
+        """
+        Updates integral after occupied cells given by coordinate arrays were emptied. Only the part below
+        and right of the first cleared row and column changes, it is updated with one cumulative sum.
+        """
+        if len(x) <= self.SLICE_UPDATE_LIMIT:
+            for cell_x, cell_y in set(zip(x.tolist(), y.tolist())):
+                self._integral[cell_y + 1:, cell_x + 1:] -= 1
+            return
+
+        x_min, y_min = x.min(), y.min()
+        cleared = np.zeros((self._map.shape[0] - y_min, self._map.shape[1] - x_min), dtype=np.int32)
+        cleared[y - y_min, x - x_min] = 1
+        self._integral[y_min + 1:, x_min + 1:] -= np.cumsum(np.cumsum(cleared, axis=0), axis=1)
+
+    def get_integral(self, out=None):
+        if out is None:
+            return self._integral.copy()
+        np.copyto(out, self._integral)
+        return out
+
+    def set_integral(self, integral):
+        np.copyto(self._integral, integral)
+
+
+class ActorGrid(object):
+    """
+    Uniform grid of board blocks holding table rows of tanks, a tank is kept in the block of its top left corner.
+    Tanks are no larger than a block, so a rectangle can only overlap tanks kept in the blocks under it
+    or one block to the left and up. Tanks have to be moved with move() after their position changes.
+
+    Buckets are python lists for single queries, their dense copy serves vectorized queries.
+    """
+    # up to this many tanks vectorized queries compare with all of them, gathering grid cells costs more
+    BRUTE_FORCE_MAX = 32
+
+    def __init__(self, table, board_size, block_size=PIXELS_PER_BLOCK, member_size=enums.TANK_COLLISION_RECTANGLE[2]):
+        assert member_size <= block_size
+
+        self._table = table
+        self._block_size = block_size
+        self._member_size = member_size
+        self._blocks = (board_size + block_size - 1) / block_size
+
+        self._buckets = [[[] for _ in xrange(self._blocks)] for _ in xrange(self._blocks)]
+        self._cells = np.full((self._blocks, self._blocks, 1), NO_ROW, dtype=np.intp)
+        self._block_of = {}
+
+    def _get_block(self, row):
+        last = self._blocks - 1
+        return (min(max(self._table.y.item(row) / self._block_size, 0), last),
+                min(max(self._table.x.item(row) / self._block_size, 0), last))
+
+    def _sync_cell(self, block):
+        bucket = self._buckets[block[0]][block[1]]
+        if len(bucket) > self._cells.shape[2]:
+            cells = np.full(self._cells.shape[:2] + (len(bucket),), NO_ROW, dtype=np.intp)
+            cells[:, :, :self._cells.shape[2]] = self._cells
+            self._cells = cells
+
+        cell = self._cells[block]
+        cell[:] = NO_ROW
+        cell[:len(bucket)] = bucket
+
+    def insert(self, row):
+        block = self._get_block(row)
+        self._block_of[row] = block
+        self._buckets[block[0]][block[1]].append(row)
+        self._sync_cell(block)
+
+    def remove(self, row):
+        block = self._block_of.pop(row)
+        self._buckets[block[0]][block[1]].remove(row)
+        self._sync_cell(block)
+
+    def move(self, row):
+        if self._get_block(row) != self._block_of[row]:
+            self.remove(row)
+            self.insert(row)
+
+    def rebuild(self, rows):
+        for line in self._buckets:
+            for bucket in line:
+                del bucket[:]
+        self._cells[...] = NO_ROW
+        self._block_of = {}
+
+        for row in rows:
+            self.insert(row)
+
+    def overlaps(self, x, y, dx, dy, exclude=NO_ROW):
+        """
+        Checks whether rectangle overlaps any tank but excluded one
+        """
+        size = self._member_size
+        x_min = max((x - size + 1) / self._block_size, 0)
+        y_min = max((y - size + 1) / self._block_size, 0)
+        x_max = (x + dx - 1) / self._block_size + 1
+        y_max = (y + dy - 1) / self._block_size + 1
+
+        table_x, table_y = self._table.x, self._table.y
+        for line in self._buckets[y_min: y_max]:
+            for bucket in line[x_min: x_max]:
+                for row in bucket:
+                    if row == exclude:
+                        continue
+
+                    other_x, other_y = table_x.item(row), table_y.item(row)
+                    if other_x < x + dx and x < other_x + size and other_y < y + dy and y < other_y + size:
+                        return True
+        return False
+
+    def find_overlaps(self, x, y, dx, dy, exclude):
+        """
+        Vectorized overlaps for arrays of rectangles, exclude holds a row per rectangle
+        """
+        size = self._member_size
+        if len(self._block_of) <= self.BRUTE_FORCE_MAX:
+            candidates = np.fromiter(self._block_of, dtype=np.intp, count=len(self._block_of))
+            other_x = self._table.x[candidates]
+            other_y = self._table.y[candidates]
+            hits = ((candidates != exclude[:, None]) &
+                    (other_x < (x + dx)[:, None]) & (x[:, None] < other_x + size) &
+                    (other_y < (y + dy)[:, None]) & (y[:, None] < other_y + size))
+            return hits.any(axis=1)
+
+        window = (int(max(dx.max(), dy.max())) + size - 2) / self._block_size + 2
+        offsets = np.arange(window)
+
+        xs = np.clip(((x - size + 1) // self._block_size)[:, None] + offsets, 0, self._blocks - 1)
+        ys = np.clip(((y - size + 1) // self._block_size)[:, None] + offsets, 0, self._blocks - 1)
+        candidates = self._cells[ys[:, :, None], xs[:, None, :]].reshape(len(x), -1)
+
+        other_x = self._table.x[candidates]
+        other_y = self._table.y[candidates]
+        hits = ((candidates != NO_ROW) & (candidates != exclude[:, None]) &
+                (other_x < (x + dx)[:, None]) & (x[:, None] < other_x + size) &
+                (other_y < (y + dy)[:, None]) & (y[:, None] < other_y + size))
+        return hits.any(axis=1)
+
+
+def brick_collision(x, y, vertical, game_state):
+    """
+    Destroys hit brick cells together with their neighbours in the direction across bullet flight
+    """
+    phase = (game_state.map[y, x].astype(np.int32) - 1) % 4
+
+    left = vertical & ((phase == 3) | (phase == 1))
+    right = vertical & ((phase == 2) | (phase == 0))
+    up = ~vertical & ((phase == 2) | (phase == 3))
+    down = ~vertical & ((phase == 1) | (phase == 0))
+
+    game_state.clear_cells(np.concatenate((x, x[left] - 1, x[right] + 1, x[up], x[down])),
+                           np.concatenate((y, y[left], y[right], y[up] - 1, y[down] + 1)))
+
+
+def concrete_collision(x, y, vertical, game_state):
     pass
 
 
@@ -73,66 +259,91 @@ STATIC_COLLISION_HANDLERS = (
 
 
 class BulletCollider(object):
+    """
+    Resolves collisions of many bullets at once, bullets are given by their actor table rows
+    """
     @staticmethod
-    def collide_wall(bullet, game_state):
-        bullet.source_tank.bullet = None
-        game_state.add_animation(AnimationFactory.make_bullet_explosion_animation(bullet))
-
-    @staticmethod
-    def collide_static(bullet, new_x, new_y, game_state):
+    def collide_static(rows, new_x, new_y, game_state):
         """
-        This algorithm assumes that bullet is no larger than minimal static environment block
+        Hits map cells in front of bullets which moved into occupied cells.
+        This algorithm assumes that bullet is no larger than minimal static environment block.
+        Returns (N, 4) array of map cell rectangles which have to be redrawn.
         """
-        bullet.source_tank.bullet = None
-        game_state.add_animation(AnimationFactory.make_bullet_explosion_animation(bullet))
+        direction = game_state.actor_table.direction[rows]
+        dx = enums.BULLET_RECT_DX[direction]
+        dy = enums.BULLET_RECT_DY[direction]
+        vertical = (direction == enums.DIRECTION_UP) | (direction == enums.DIRECTION_DOWN)
 
-        x, y, dx, dy = bullet.get_collision_rect()
-        x, y = new_x + x, new_y + y
+        x_min = np.where(vertical | (direction == enums.DIRECTION_LEFT), new_x, new_x + dx) / 4
+        y_min = np.where(~vertical | (direction == enums.DIRECTION_UP), new_y, new_y + dy) / 4
+        x_max = np.where(vertical, (new_x + dx + 3) / 4, x_min + 1)
+        y_max = np.where(vertical, y_min + 1, (new_y + dy + 3) / 4)
 
-        if bullet.direction == enums.ActorDirections.UP or bullet.direction == enums.ActorDirections.DOWN:
-            if bullet.direction == enums.ActorDirections.UP:
-                col_y_min = y / 4
-                col_y_max = col_y_min + 1
+        limit = game_state.map.shape[0] - 1
+        need_update = np.zeros(len(rows), dtype=np.bool_)
 
-            else:
-                col_y_min = (y + dy) / 4
-                col_y_max = col_y_min + 1
+        # far cell is looked up after near cell was hit, as it may have been destroyed with it
+        for x, y in ((x_min, y_min), (x_max - 1, y_max - 1)):
+            x, y = np.clip(x, 0, limit), np.clip(y, 0, limit)
+            material = (game_state.map[y, x].astype(np.int32) - 1) / STATIC_SPRITE_TYPE_COUNT
+            need_update |= material >= 0
 
-            col_x_min = x / 4
-            col_x_max = (x + dx + 3) / 4
+            for index, handler in enumerate(STATIC_COLLISION_HANDLERS):
+                hit = material == index
+                if hit.any():
+                    handler(x[hit], y[hit], vertical[hit], game_state)
 
-        else:
-            if bullet.direction == enums.ActorDirections.LEFT:
-                col_x_min = x / 4
-                col_x_max = col_x_min + 1
+        return np.column_stack((x_min - 1, y_min - 1, x_max - x_min + 2, y_max - y_min + 2))[need_update]
 
-            else:
-                col_x_min = (x + dx) / 4
-                col_x_max = col_x_min + 1
+    @staticmethod
+    def collide_actors(rows, new_x, new_y, game_state):
+        """
+        Returns mask of bullets which moved into tanks other than their source tank
+        """
+        if len(game_state.actors) < 2:
+            return np.zeros(len(rows), dtype=np.bool_)
+
+        table = game_state.actor_table
+        direction = table.direction[rows]
+        return game_state.actor_grid.find_overlaps(new_x, new_y, enums.BULLET_RECT_DX[direction],
+                                                   enums.BULLET_RECT_DY[direction], table.owner[rows])
+
+    @staticmethod
+    def explode(rows, game_state):
+        """
+        Replaces bullets with explosion animations.
+        Bullets are removed at the very end, their table rows may be reused afterwards.
+        """
+        table = game_state.actor_table
+        for animation in AnimationFactory.make_bullet_explosion_animations(table, rows):
+            game_state.add_animation(animation)
 
-            col_y_min = y / 4
-            col_y_max = (y + dy + 3) / 4
+        for row in rows:
+            table.objects[row].source_tank.bullet = None
 
-        need_update = False
 
-        mat_min = (game_state.map[col_y_min, col_x_min] - 1) / 4
-        if mat_min >= 0:
-            STATIC_COLLISION_HANDLERS[mat_min](col_x_min, col_y_min, bullet.direction, game_state)
-            need_update = True
+class GameSnapshot(object):
+    """
+    Flat copy of GameState. Actor rows are
+    (x, y, direction, step cycle, step counter, has bullet, bullet x, bullet y, bullet direction),
+    animation rows are (x, y, sprite counter, is dead).
+    """
+    __slots__ = ('map', 'integral', 'actors', 'animations')
 
-        mat_max = (game_state.map[col_y_max - 1, col_x_max - 1] - 1) / 4
-        if mat_max >= 0:
-            STATIC_COLLISION_HANDLERS[mat_max](col_x_max - 1, col_y_max - 1, bullet.direction, game_state)
-            need_update = True
+    ACTOR_COLUMNS = 9
+    ANIMATION_COLUMNS = 4
 
-        if need_update:
-            return col_x_min - 1, col_y_min - 1, col_x_max - col_x_min + 2, col_y_max - col_y_min + 2
+    def __init__(self, map, integral, actors, animations):
+        self.map = map
+        self.integral = integral
+        self.actors = actors
+        self.animations = animations
 
-        return None
 
-    @staticmethod
-    def collide_actor(bullet, actor, game_state):
-        pass
+def _reuse_array(array, shape):
+    if array is not None and array.shape == shape:
+        return array
+    return np.empty(shape, dtype=np.int32)
 
 
 class GameState(object):
@@ -140,134 +351,526 @@ class GameState(object):
 
     def __init__(self, map):
         self.map = map
+        self.collision_index = CollisionIndex(map)
+        self.actor_table = ActorTable()
+        self.actor_grid = ActorGrid(self.actor_table, self.BOARD_SIZE)
         self.actors = []
         self.animations = []
 
+    def clear_cells(self, x, y):
+        """
+        Clears map cells given by coordinate arrays, collision index is updated once for all of them
+        """
+        occupied = self.map[y, x] != 0
+        if np.any(occupied):
+            x, y = x[occupied], y[occupied]
+            self.map[y, x] = 0
+            self.collision_index.cells_cleared(x, y)
+
     def add_actor(self, actor):
+        self.actor_table.adopt(actor)
+        self.actor_grid.insert(actor._row)
         self.actors.append(actor)
         return self
 
     def add_animation(self, animation):
+        self.actor_table.adopt(animation)
         self.animations.append(animation)
 
+    def snapshot(self, out=None):
+        """
+        Arrays of out snapshot are reused where their shapes allow and returned in it
+        """
+        table = self.actor_table
+
+        rows = table.rows_of(self.actors)
+        bullet_rows = table.bullet[rows]
+        has_bullet = bullet_rows != NO_ROW
+
+        actors = _reuse_array(out and out.actors, (len(rows), GameSnapshot.ACTOR_COLUMNS))
+        actors[:, 0] = table.x[rows]
+        actors[:, 1] = table.y[rows]
+        actors[:, 2] = table.direction[rows]
+        actors[:, 3] = table.step_cycle[rows]
+        actors[:, 4] = table.step_counter[rows]
+        actors[:, 5] = has_bullet
+        actors[:, 6] = np.where(has_bullet, table.x[bullet_rows], 0)
+        actors[:, 7] = np.where(has_bullet, table.y[bullet_rows], 0)
+        actors[:, 8] = np.where(has_bullet, table.direction[bullet_rows], 0)
+
+        rows = table.rows_of(self.animations)
+        animations = _reuse_array(out and out.animations, (len(rows), GameSnapshot.ANIMATION_COLUMNS))
+        animations[:, 0] = table.x[rows]
+        animations[:, 1] = table.y[rows]
+        animations[:, 2] = table.sprite_counter[rows]
+        animations[:, 3] = table.is_dead[rows]
+
+        if out is None:
+            return GameSnapshot(self.map.copy(), self.collision_index.get_integral(), actors, animations)
+
+        np.copyto(out.map, self.map)
+        self.collision_index.get_integral(out=out.integral)
+        out.actors = actors
+        out.animations = animations
+        return out
+
+    def restore(self, snapshot):
+        """
+        Restores state in place. Actors have to be the same as when the snapshot was taken,
+        bullet and animation objects are reused where possible.
+        Renderer has to be reset with set_game_state afterwards.
+        """
+        assert len(snapshot.actors) == len(self.actors)
+        table = self.actor_table
+
+        np.copyto(self.map, snapshot.map)
+        self.collision_index.set_integral(snapshot.integral)
+
+        actors = snapshot.actors
+        for actor, has_bullet in zip(self.actors, actors[:, 5].tolist()):
+            if not has_bullet:
+                actor.bullet = None
+            elif actor.bullet is None:
+                actor.bullet = table.acquire(Bullet, 0, 0, enums.ActorDirections.UP, actor)
+
+        rows = table.rows_of(self.actors)
+        table.x[rows] = actors[:, 0]
+        table.y[rows] = actors[:, 1]
+        table.direction[rows] = actors[:, 2]
+        table.step_cycle[rows] = actors[:, 3]
+        table.step_counter[rows] = actors[:, 4]
+        self.actor_grid.rebuild(rows.tolist())
+
+        has_bullet = actors[:, 5] != 0
+        bullet_rows = table.bullet[rows[has_bullet]]
+        table.x[bullet_rows] = actors[has_bullet, 6]
+        table.y[bullet_rows] = actors[has_bullet, 7]
+        table.direction[bullet_rows] = actors[has_bullet, 8]
+
+        count = len(snapshot.animations)
+        animations = self.animations
+        for animation in animations[count:]:
+            table.recycle(animation._row)
+        del animations[count:]
+        while len(animations) < count:
+            animations.append(table.acquire(Animation, enums.ShotAnimationSprites, 0, 0,
+                                            enums.BULLET_EXPLOSION_ANIMATION_RECT, table=table))
+
+        rows = table.rows_of(animations)
+        table.x[rows] = snapshot.animations[:, 0]
+        table.y[rows] = snapshot.animations[:, 1]
+        table.sprite_counter[rows] = snapshot.animations[:, 2]
+        table.is_dead[rows] = snapshot.animations[:, 3]
+
 
 class GameEngine(object):
+    """
+    Tick runs in phases: animations advance, batch policies choose actions of their tanks, every tank
+    acts and moves, then all live bullets are advanced and collided in one batch, and bullets fired
+    on this tick are spawned in another batch.
+    """
+    PROFILED_METHODS = ('tick', '_tick_animations', '_run_policies', '_select_action', '_move_actor',
+                        '_check_can_move', '_move_bullets', '_spawn_bullets', '_resolve_bullets', '_resolve_few_bullets')
+
+    # with fewer bullets or animations they are handled one by one, numpy call overhead would dominate
+    VECTORIZED_BULLETS_MIN = 16
+    VECTORIZED_ANIMATIONS_MIN = 8
+    PROFILED_COLLIDER_METHODS = ('collide_static', 'collide_actors', 'explode')
+
     def __init__(self, game_state):
         self._state = game_state
+        self._renderer = None
+        self._recorder = None
+        self._bullet_collider = BulletCollider
 
     def set_renderer(self, renderer):
         self._renderer = renderer
 
-    def _move_actor(self, actor, direction, collider=None):
-        self._renderer.clear_actor(actor)
+    def set_recorder(self, recorder):
+        """
+        Recorder gets list of action values of all tanks after every tick, None stops recording
+        """
+        self._recorder = recorder
 
-        actor.direction = direction
-        dx, dy = enums.DIRECTION_VECTORS[actor.direction.value]
-        dx *= actor.moving_speed
-        dy *= actor.moving_speed
+    def set_profiler(self, profiler):
+        """
+        Instruments engine phases with PhaseProfiler, None removes instrumentation
+        """
+        PhaseProfiler.uninstrument(self, self.PROFILED_METHODS)
+        self._bullet_collider = BulletCollider
 
-        if self._check_can_move(actor, actor.x + dx, actor.y + dy, collider):
-            actor.y += dy
-            actor.x += dx
-        actor.animate()
+        if profiler is not None:
+            profiler.instrument(self, self.PROFILED_METHODS, 'engine')
+            self._bullet_collider = profiler.instrument(InstrumentedProxy(BulletCollider),
+                                                        self.PROFILED_COLLIDER_METHODS, 'collider')
 
-    def _apply_action(self, actor):
-        action = actor.get_action(self._state)
+    def _move_actor(self, actor, direction):
+        """
+        Turns tank to given direction value and moves it one step if the way is free
+        """
+        if self._renderer is not None:
+            self._renderer.clear_actor(actor)
 
-        if action.value < 4:
-            self._move_actor(actor, enums.ActorDirections(action.value))
+        table, row = actor._table, actor._row
+        table.direction[row] = direction
 
-        if actor.bullet is not None:
-            self._move_actor(actor.bullet, actor.bullet.direction, BulletCollider)
+        dx, dy = enums.DIRECTION_VECTORS[direction]
+        speed = table.speed.item(row)
+        new_x = table.x.item(row) + dx * speed
+        new_y = table.y.item(row) + dy * speed
 
-        if action == enums.Actions.SHOOT:
-            if actor.bullet is None:
-                dx, dy = enums.BULLET_TANK_SHIFTS[actor.direction.value]
-                actor.bullet = Bullet(actor.x + dx, actor.y + dy, actor.direction, actor)
-                self._check_can_move(actor.bullet, actor.bullet.x, actor.bullet.y, collider=BulletCollider)
+        if self._check_can_move(actor, new_x, new_y):
+            table.x[row] = new_x
+            table.y[row] = new_y
+            self._state.actor_grid.move(row)
 
-    def _check_can_move(self, actor, new_x, new_y, collider=None):
-        x, y, dx, dy = actor.get_collision_rect()
+    def _select_action(self, actor):
+        return actor.get_action(self._state)
+
+    def _run_policies(self):
+        """
+        Calls each batch policy once with all its tanks, policy returns actions or action values in the same order
+        """
+        policies = []
+        tanks = {}
+        for actor in self._state.actors:
+            if isinstance(actor, PolicyPlayer):
+                if actor.policy not in tanks:
+                    policies.append(actor.policy)
+                    tanks[actor.policy] = []
+                tanks[actor.policy].append(actor)
+
+        for policy in policies:
+            actors = tanks[policy]
+            actions = policy(self._state, actors)
+            assert len(actions) == len(actors)
+
+            for actor, action in zip(actors, actions):
+                actor.action = enums.Actions(action)
+
+    def _check_can_move(self, actor, new_x, new_y):
+        x, y, dx, dy = enums.TANK_COLLISION_RECTANGLE
 
         max_y = self._state.BOARD_SIZE - y - dy
         max_x = self._state.BOARD_SIZE - x - dx
 
         if 0 <= new_x <= max_x and 0 <= new_y <= max_y:
-            if np.sum(self._state.map[(new_y + y) / 4: (new_y + y + dy + 3) / 4,
-                                      (new_x + x) / 4: (new_x + x + dx + 3) / 4]) == 0:
-                return True
-            else:
-                if collider is not None:
-                    update_rec = collider.collide_static(actor, new_x, new_y, self._state)
-                    if update_rec is not None:
-                        self._renderer.update_bg(update_rec)
-                return False
-
-        if collider is not None:
-            collider.collide_wall(actor, self._state)
+            return (self._state.collision_index.is_free((new_x + x) / 4, (new_y + y) / 4,
+                                                        (new_x + x + dx + 3) / 4, (new_y + y + dy + 3) / 4) and
+                    not self._state.actor_grid.overlaps(new_x + x, new_y + y, dx, dy, actor._row))
         return False
 
+    def _move_bullets(self):
+        table = self._state.actor_table
+        rows = [table.bullet.item(actor._row) for actor in self._state.actors]
+        rows = [row for row in rows if row != NO_ROW]
+        if len(rows) < self.VECTORIZED_BULLETS_MIN:
+            self._move_few_bullets(rows)
+            return
+
+        rows = np.array(rows, dtype=np.intp)
+        x, y = table.x[rows], table.y[rows]
+        direction = table.direction[rows]
+        if self._renderer is not None:
+            self._renderer.clear_rects(x, y, enums.BULLET_RECT_DX[direction], enums.BULLET_RECT_DY[direction])
+
+        speed = table.speed[rows]
+        new_x = x + enums.DIRECTION_DX[direction] * speed
+        new_y = y + enums.DIRECTION_DY[direction] * speed
+
+        can_move = self._resolve_bullets(rows, new_x, new_y)
+        rows = rows[can_move]
+        table.x[rows] = new_x[can_move]
+        table.y[rows] = new_y[can_move]
+
+    def _move_few_bullets(self, rows):
+        """
+        _move_bullets on python numbers, it is faster for a few bullets
+        """
+        if not rows:
+            return
+
+        table = self._state.actor_table
+        if self._renderer is not None:
+            direction = table.direction[rows]
+            self._renderer.clear_rects(table.x[rows], table.y[rows],
+                                       enums.BULLET_RECT_DX[direction], enums.BULLET_RECT_DY[direction])
+
+        new_x = []
+        new_y = []
+        for row in rows:
+            dx, dy = enums.DIRECTION_VECTORS[table.direction.item(row)]
+            speed = table.speed.item(row)
+            new_x.append(table.x.item(row) + dx * speed)
+            new_y.append(table.y.item(row) + dy * speed)
+
+        collided = self._resolve_few_bullets(rows, new_x, new_y)
+        for row, x, y, blocked in zip(rows, new_x, new_y, collided):
+            if not blocked:
+                table.x[row] = x
+                table.y[row] = y
+
+    def _spawn_bullets(self, shooters):
+        table = self._state.actor_table
+        rows = []
+        new_x = []
+        new_y = []
+        for tank in shooters:
+            row = tank._row
+            if table.bullet.item(row) != NO_ROW:
+                continue
+
+            direction = table.direction.item(row)
+            shift_x, shift_y = enums.BULLET_TANK_SHIFTS[direction]
+            x, y = table.x.item(row) + shift_x, table.y.item(row) + shift_y
+            bullet = table.acquire(Bullet, x, y, ACTOR_DIRECTIONS[direction], tank)
+            tank.bullet = bullet
+            rows.append(bullet._row)
+            new_x.append(x)
+            new_y.append(y)
+
+        if len(rows) < self.VECTORIZED_BULLETS_MIN:
+            self._resolve_few_bullets(rows, new_x, new_y)
+        else:
+            self._resolve_bullets(np.array(rows, dtype=np.intp), np.array(new_x, dtype=np.int32),
+                                  np.array(new_y, dtype=np.int32))
+
+    def _resolve_bullets(self, rows, new_x, new_y):
+        """
+        Collides bullets moving to new positions with walls, map and tanks at once.
+        Collided bullets explode, returns mask of bullets which can move.
+        """
+        static_hit, collided = self._check_bullets(rows, new_x, new_y)
+        self._collide_bullets(rows, new_x, new_y, static_hit, collided)
+        return ~collided
+
+    def _resolve_few_bullets(self, rows, new_x, new_y):
+        """
+        _resolve_bullets for lists of a few bullets, returns list of flags of collided bullets
+        """
+        state = self._state
+        table = state.actor_table
+        board_size = state.BOARD_SIZE
+        check_actors = len(state.actors) >= 2
+
+        static_hit = []
+        collided = []
+        for row, x, y in zip(rows, new_x, new_y):
+            _, _, dx, dy = enums.BULLET_COLLISION_RECTANGLES[table.direction.item(row)]
+
+            if x < 0 or y < 0 or x + dx > board_size or y + dy > board_size:
+                hit, blocked = False, True
+            elif not state.collision_index.is_free(x / 4, y / 4, (x + dx + 3) / 4, (y + dy + 3) / 4):
+                hit, blocked = True, True
+            else:
+                hit = False
+                blocked = check_actors and state.actor_grid.overlaps(x, y, dx, dy, table.owner.item(row))
+            static_hit.append(hit)
+            collided.append(blocked)
+
+        if any(collided):
+            self._collide_bullets(np.array(rows, dtype=np.intp), np.array(new_x, dtype=np.int32),
+                                  np.array(new_y, dtype=np.int32), np.array(static_hit), np.array(collided))
+        return collided
+
+    def _collide_bullets(self, rows, new_x, new_y, static_hit, collided):
+        """
+        Applies hits given by masks: map cells hit by bullets are cleared, then collided bullets explode
+        """
+        if static_hit.any():
+            update_rects = self._bullet_collider.collide_static(rows[static_hit], new_x[static_hit],
+                                                                new_y[static_hit], self._state)
+            if self._renderer is not None:
+                for rect in update_rects.tolist():
+                    self._renderer.update_bg(rect)
+
+        if collided.any():
+            self._bullet_collider.explode(rows[collided], self._state)
+
+    def _check_bullets(self, rows, new_x, new_y):
+        """
+        Returns masks of bullets which hit the map and of all collided bullets, the map is not changed yet
+        """
+        state = self._state
+
+        direction = state.actor_table.direction[rows]
+        dx = enums.BULLET_RECT_DX[direction]
+        dy = enums.BULLET_RECT_DY[direction]
+
+        bounds = np.array((new_x, new_y, new_x + dx, new_y + dy))
+        in_bounds = (bounds.min(axis=0) >= 0) & (bounds[2:].max(axis=0) <= state.BOARD_SIZE)
+
+        # cells of positions out of bounds are clipped only to keep lookups valid, they are masked out
+        bounds[2:] += 3
+        bounds /= 4
+        np.clip(bounds, 0, state.BOARD_SIZE / 4, out=bounds)
+        free = state.collision_index.count(*bounds) == 0
+
+        static_hit = in_bounds & ~free
+        collided = ~in_bounds | static_hit
+
+        moving = ~collided
+        if moving.any():
+            collided[moving] = self._bullet_collider.collide_actors(rows[moving], new_x[moving], new_y[moving], state)
+        return static_hit, collided
+
+    def _tick_animations(self):
+        table = self._state.actor_table
+        animations = self._state.animations
+        if not animations:
+            return
+
+        if len(animations) < self.VECTORIZED_ANIMATIONS_MIN:
+            for index in xrange(len(animations) - 1, -1, -1):
+                row = animations[index]._row
+                if table.is_dead.item(row):
+                    table.recycle(row)
+                    del animations[index]
+
+            for animation in animations:
+                table.tick_animation(animation._row)
+            return
+
+        rows = table.rows_of(animations)
+
+        dead = table.is_dead[rows] != 0
+        if dead.any():
+            # animations live equally long, so dead ones are usually a prefix and list is compacted in place
+            for index in np.flatnonzero(dead)[::-1].tolist():
+                table.recycle(rows[index])
+                del animations[index]
+            rows = rows[~dead]
+
+        table.tick_animations(rows)
+
     def tick(self):
-        new_animation_list = []
-        for animation in self._state.animations:
-            if not animation.is_dead:
-                animation.tick()
-                new_animation_list.append(animation)
-        self._state.animations = new_animation_list
+        self._tick_animations()
+        self._run_policies()
+
+        table = self._state.actor_table
+        actions = []
+        shooters = []
+        for actor in self._state.actors:
+            action = self._select_action(actor).value
+            actions.append(action)
+            if action < 4:
+                self._move_actor(actor, action)
+                table.animate_tank(actor._row)
+            elif action == enums.ACTION_SHOOT:
+                shooters.append(actor)
+
+        self._move_bullets()
+        if shooters:
+            self._spawn_bullets(shooters)
 
-        for actor in game_state.actors:
-            self._apply_action(actor)
+        if self._recorder is not None:
+            self._recorder.record_tick(actions)
 
 
 class Renderer(object):
     OFF_BOARD_SPACE = 8
 
-    def __init__(self, game_state, screen, scale=4):
-        self.size = (game_state.BOARD_SIZE + self.OFF_BOARD_SPACE * 2) * scale
+    PROFILED_METHODS = ('render', 'update_bg', '_render_env')
+
+    def __init__(self, game_state, screen, scale=4, clear_actors=False):
+        """
+        With clear_actors tanks and bullets drawn on previous frame are cleared by render itself,
+        for game states which change without engine calling clear_actor
+        """
+        self.size = self.get_screen_size(scale)
         self._scale = scale
         self._game_state = game_state
-        self._sprite_storage = SpriteStorage('../data/tank_sprite.png', self._scale)
+        self._sprite_storage = SpriteStorage(SPRITE_FILE, self._scale, cache_dir=SPRITE_CACHE_DIR)
+        self._clear_actors = clear_actors
+        self._drawn_rects = []
+
+        self._static_tiles = self._sprite_storage.get_static_object_tiles()
+        self._background = np.zeros((self.size, self.size), dtype=np.uint8)
 
         self._screen = screen
         self._screen.init_screen(self.size, self._sprite_storage.palette)
+        self._screen.load_sprites(self._sprite_storage)
 
         self._render_env()
 
+    def set_profiler(self, profiler):
+        """
+        Instruments rendering phases with PhaseProfiler, None removes instrumentation
+        """
+        PhaseProfiler.uninstrument(self, self.PROFILED_METHODS)
+        if profiler is not None:
+            profiler.instrument(self, self.PROFILED_METHODS, 'renderer')
+
+    @classmethod
+    def get_screen_size(cls, scale):
+        return (GameState.BOARD_SIZE + cls.OFF_BOARD_SPACE * 2) * scale
+
+    def set_game_state(self, game_state):
+        """
+        Switches renderer to another game, screen is redrawn from scratch
+        """
+        self._game_state = game_state
+        self._drawn_rects = []
+        self._render_env()
+
     def render(self):
-        for animation in self._game_state.animations:
-            _, _, dx, dy = animation.sprite_size
-            self._screen.clear(self._make_screen_rect(animation.x, animation.y, dx, dy))
-            self.update_bg((animation.x / 4, animation.y / 4, (dx + 3) / 4 + 1, (dy + 3) / 4 + 1))
+        # animations drawn on previous frame are cleared even if they were dropped by skipped ticks
+        for x, y, dx, dy in self._drawn_rects:
+            self._screen.restore_background(self._make_screen_rect(x, y, dx, dy))
+        drawn_rects = self._drawn_rects = []
 
         for actor in self._game_state.actors:
             sprite = self._sprite_storage.get_tank_actor_sprite(actor)
             self._lay_sprite(sprite, actor.x, actor.y)
+            if self._clear_actors:
+                drawn_rects.append((actor.x, actor.y) + actor.get_collision_rect()[2:])
 
             bullet = actor.bullet
             if bullet is not None:
                 sprite = self._sprite_storage.get_bullet_actor_sprite(bullet)
                 self._lay_sprite(sprite, bullet.x, bullet.y)
+                if self._clear_actors:
+                    drawn_rects.append((bullet.x, bullet.y) + bullet.get_collision_rect()[2:])
 
         for animation in self._game_state.animations:
             if not animation.is_dead:
                 sprite = self._sprite_storage.get_animation_sprite(animation)
                 self._lay_sprite(sprite, animation.x, animation.y)
 
+                _, _, dx, dy = animation.sprite_size
+                drawn_rects.append((animation.x, animation.y, dx, dy))
+
         return self._screen
 
+    def present(self):
+        self._screen.present()
+
     def _make_screen_rect(self, x, y , dx, dy):
         return ((x + self.OFF_BOARD_SPACE) * self._scale,
                 (y + self.OFF_BOARD_SPACE) * self._scale,
                  dx * self._scale,
                  dy * self._scale)
 
+    def _compose_tiles(self, cells):
+        """
+        Builds pixels of map cells region at once, tile 0 is empty
+        """
+        tiles = self._static_tiles[cells]
+        rows, columns, tile_size, _ = tiles.shape
+        return tiles.transpose(0, 2, 1, 3).reshape(rows * tile_size, columns * tile_size)
+
     def _render_env(self):
-        for x in xrange(self._game_state.map.shape[0]):
-            for y in xrange(self._game_state.map.shape[1]):
-                obj_index = self._game_state.map[y, x]
-                if obj_index != 0:
-                    sprite = self._sprite_storage.get_static_object_sprite(obj_index - 1)
-                    self._lay_sprite(sprite, x * 4, y * 4)
+        """
+        Rebuilds background layer from the whole map and shows it
+        """
+        offset = self.OFF_BOARD_SPACE * self._scale
+        board = self._compose_tiles(self._game_state.map)
+
+        self._background[...] = 0
+        self._background[offset: offset + board.shape[0], offset: offset + board.shape[1]] = board
+
+        self._screen.set_background(self._background)
+        self._screen.restore_background((0, 0, self.size, self.size))
 
     def _lay_sprite(self, sprite, x, y):
         x += self.OFF_BOARD_SPACE
@@ -279,47 +882,209 @@ class Renderer(object):
 
     def clear_actor(self, actor):
         _, _, dx, dy = actor.get_collision_rect()
-        self._screen.clear(self._make_screen_rect(actor.x, actor.y, dx, dy))
+        self._screen.restore_background(self._make_screen_rect(actor.x, actor.y, dx, dy))
+
+    def clear_rects(self, x, y, dx, dy):
+        for rect in zip(x.tolist(), y.tolist(), dx.tolist(), dy.tolist()):
+            self._screen.restore_background(self._make_screen_rect(*rect))
 
     def update_bg(self, rec):
-        x_max = min(rec[0] + rec[2], self._game_state.BOARD_SIZE / 4)
+        """
+        Patches background layer for changed map cells and shows the patched region
+        """
+        x_max = min(rec[0] + rec[2], self._game_state.BOARD_SIZE / enums.CELL_SIZE)
         x_min = max(rec[0], 0)
 
-        y_max = min(rec[1] + rec[3], self._game_state.BOARD_SIZE / 4)
+        y_max = min(rec[1] + rec[3], self._game_state.BOARD_SIZE / enums.CELL_SIZE)
         y_min = max(rec[1], 0)
 
-        for x in xrange(x_min, x_max):
-            for y in xrange(y_min, y_max):
-                obj_index = self._game_state.map[y, x]
-                if obj_index != 0:
-                    sprite = self._sprite_storage.get_static_object_sprite(obj_index - 1)
-                    self._lay_sprite(sprite, x * 4, y * 4)
+        if x_min >= x_max or y_min >= y_max:
+            return
+
+        rect = self._make_screen_rect(x_min * enums.CELL_SIZE, y_min * enums.CELL_SIZE,
+                                      (x_max - x_min) * enums.CELL_SIZE, (y_max - y_min) * enums.CELL_SIZE)
+        x, y, dx, dy = rect
+        self._background[y: y + dy, x: x + dx] = self._compose_tiles(self._game_state.map[y_min: y_max, x_min: x_max])
+
+        self._screen.update_background(rect, self._background[y: y + dy, x: x + dx])
+        self._screen.restore_background(rect)
 
-                else:
-                    self._screen.clear(self._make_screen_rect(x * 4, y * 4, 4, 4))
+
+def sprite_key(sprite):
+    """
+    Identifies sprite by its memory, so transposed views of the same sprite share the key.
+    Sprites have to be kept alive while the key is used, otherwise the memory can be reused by another array.
+    """
+    return sprite.__array_interface__['data'][0], sprite.shape, sprite.strides
+
+
+def merge_rects(rects):
+    """
+    Merges overlapping rectangles into their bounding rectangles until none of them overlap
+    """
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
 
 
 class PyGameScreen(object):
-    def __init__(self):
+    def __init__(self, convert_surfaces=False, full_flip=False):
         self._screen = None
         self._palette = None
+        self._surface_palette = None
+        self._convert_surfaces = convert_surfaces
+
+        self.full_flip = full_flip
+        self._dirty_rects = []
+        self._needs_flip = True
+
+        self._background = None
+
+        self._surfaces = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def init_screen(self, size, palette=None):
         self._screen = pygame.display.set_mode((size, size))
         self._palette = palette
 
+        i_p = iter(self._palette)
+        self._surface_palette = list(zip(i_p, i_p, i_p))
+        self._surfaces = {}
+
+        self._dirty_rects = []
+        self._needs_flip = True
+
+    def load_sprites(self, sprite_storage):
+        """
+        Caches surfaces of all sprites of the storage. The cache holds the sprites, so their keys stay valid.
+        """
+        for sprite in sprite_storage.iter_sprites():
+            sprite = sprite.T
+            self._surfaces[sprite_key(sprite)] = (self._make_surface(sprite), sprite)
+
     def _make_surface(self, sprite):
         sprite_sf = pygame.surfarray.make_surface(sprite)
         sprite_sf.set_colorkey(0)
-        i_p = iter(self._palette)
-        sprite_sf.set_palette(list(zip(i_p, i_p, i_p)))
+        sprite_sf.set_palette(self._surface_palette)
+        if self._convert_surfaces:
+            sprite_sf = sprite_sf.convert()
         return sprite_sf
 
+    def _get_surface(self, sprite):
+        cached = self._surfaces.get(sprite_key(sprite))
+        if cached is None:
+            # arrays which were not loaded are drawn from throwaway surfaces, their memory may be reused later
+            self.cache_misses += 1
+            return self._make_surface(sprite)
+
+        self.cache_hits += 1
+        return cached[0]
+
+    def put_sprite(self, sprite, rect):
+        self._dirty_rects.append(self._screen.blit(self._get_surface(sprite), rect))
+
+    def clear(self, rect):
+        self._dirty_rects.append(self._screen.fill(0, rect))
+
+    def set_background(self, background):
+        self._background = pygame.surfarray.make_surface(background.T)
+        self._background.set_palette(self._surface_palette)
+
+    def update_background(self, rect, pixels):
+        pygame.surfarray.blit_array(self._background.subsurface(rect), pixels.T)
+
+    def restore_background(self, rect):
+        self._dirty_rects.append(self._screen.blit(self._background, rect, rect))
+
+    def present(self):
+        """
+        Shows changes made since previous call. Only changed regions are updated
+        unless full_flip is set or the whole screen was drawn
+        """
+        if self.full_flip or self._needs_flip:
+            pygame.display.flip()
+        elif self._dirty_rects:
+            pygame.display.update(merge_rects(self._dirty_rects))
+
+        self._dirty_rects = []
+        self._needs_flip = False
+
+
+class NumpyScreen(object):
+    """
+    Off-screen screen which draws palette indices into preallocated uint8 buffer.
+    Works without display, sprites are passed transposed as for pygame surfarray.
+    Buffer can be supplied by caller, e.g. to render straight into shared memory.
+    """
+    def __init__(self, buffer=None):
+        self._buffer = buffer
+        self._background = None
+        self.palette = None
+
+    def init_screen(self, size, palette=None):
+        if self._buffer is None:
+            self._buffer = np.zeros((size, size), dtype=np.uint8)
+        else:
+            assert self._buffer.shape == (size, size) and self._buffer.dtype == np.uint8
+            self._buffer[...] = 0
+        self.palette = palette
+
+    def load_sprites(self, sprite_storage):
+        pass
+
+    def present(self):
+        pass
+
+    def _clip_rect(self, rect):
+        x, y, dx, dy = rect
+        height, width = self._buffer.shape
+        return max(x, 0), max(y, 0), min(x + dx, width), min(y + dy, height)
+
     def put_sprite(self, sprite, rect):
-        self._screen.blit(self._make_surface(sprite), rect)
+        sprite = sprite.T
+        x, y = rect[0], rect[1]
+        x_min, y_min, x_max, y_max = self._clip_rect((x, y, sprite.shape[1], sprite.shape[0]))
+        if x_min >= x_max or y_min >= y_max:
+            return
+
+        sprite = sprite[y_min - y: y_max - y, x_min - x: x_max - x]
+        target = self._buffer[y_min: y_max, x_min: x_max]
+        np.copyto(target, sprite, where=sprite != 0)
 
     def clear(self, rect):
-        self._screen.fill(0, rect)
+        x_min, y_min, x_max, y_max = self._clip_rect(rect)
+        self._buffer[y_min: y_max, x_min: x_max] = 0
+
+    def set_background(self, background):
+        self._background = background
+
+    def update_background(self, rect, pixels):
+        # background array is shared with the renderer, it is already patched
+        pass
+
+    def restore_background(self, rect):
+        x_min, y_min, x_max, y_max = self._clip_rect(rect)
+        self._buffer[y_min: y_max, x_min: x_max] = self._background[y_min: y_max, x_min: x_max]
+
+    @property
+    def observation(self):
+        """
+        Read-only view of screen buffer, it is updated in place by the renderer
+        """
+        view = self._buffer.view()
+        view.flags.writeable = False
+        return view
+
+    def to_rgb(self):
+        palette = np.asarray(self.palette, dtype=np.uint8).reshape(-1, 3)
+        return palette[self._buffer]
 
 
 if __name__ == "__main__":
@@ -333,18 +1098,17 @@ if __name__ == "__main__":
                 map_builder.add_bricks(i, j)
 
     map = map_builder.get_map()
-    game_state = GameState(map).add_actor(PyGameKeyboardPlayer(0, 192, enums.ActorSpriteEnum.PLAYER_1_TANK))
 
     pygame.init()
 
+    input_manager = InputManager()
+    game_state = GameState(map) \
+        .add_actor(PyGameKeyboardPlayer(0, 192, enums.ActorSpriteEnum.PLAYER_1_TANK, input_manager)) \
+        .add_actor(PyGameKeyboardPlayer(192, 192, enums.ActorSpriteEnum.QUICK_TANK, input_manager, ARROW_BINDINGS))
+
     engine = GameEngine(game_state)
     renderer = Renderer(game_state, PyGameScreen())
     engine.set_renderer(renderer)
 
-    clock = pygame.time.Clock()
-
-    while True:
-        engine.tick()
-        image = renderer.render()
-        pygame.display.flip()
-        pygame.time.delay(16)
+    GameLoop(engine, renderer, tick_rate=60, render_rate=60, input_manager=input_manager) \
+        .run(should_stop=lambda: input_manager.quit_requested)
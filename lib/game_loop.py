@@ -0,0 +1,98 @@
+import time
+
+# accumulated wall time is compared with tolerance, rounding must not leave a full tick unrun
+TICK_EPSILON = 1e-9
+
+
+class GameLoop(object):
+    """
+    Runs engine at fixed simulation timestep independently of rendering.
+
+    Wall time is accumulated and spent on as many ticks as fit into it, so several ticks
+    can run per rendered frame. Frames are rendered at render_rate, None disables rendering.
+    In max_speed mode the loop never sleeps: ticks run back to back and frames are still
+    rendered at render_rate of wall time, which fast-forwards matches.
+    Input manager is polled once per step, before the ticks of the step.
+    """
+    def __init__(self, engine, renderer=None, tick_rate=60, render_rate=60, max_speed=False,
+                 max_ticks_per_step=10, clock=time.time, sleep=time.sleep, input_manager=None):
+        self._engine = engine
+        self._renderer = renderer
+        self._input_manager = input_manager
+
+        self.tick_time = 1.0 / tick_rate
+        self.render_time = 1.0 / render_rate if render_rate else None
+        self.max_speed = max_speed
+        self._max_ticks_per_step = max_ticks_per_step
+
+        self._clock = clock
+        self._sleep = sleep
+
+        self._accumulator = 0.0
+        self._last_time = None
+        self._next_render = None
+
+        self.ticks = 0
+        self.frames = 0
+
+    def _render(self, now):
+        if self._renderer is None or self.render_time is None:
+            return
+
+        if now >= self._next_render:
+            self._renderer.render()
+            self._renderer.present()
+            self.frames += 1
+            # frames which could not be shown in time are dropped instead of rendered in a burst
+            self._next_render = max(self._next_render + self.render_time, now)
+
+    def step(self, tick_limit=None):
+        """
+        Runs ticks which are due (at most tick_limit), renders a frame if it is due. Returns number of ticks run.
+        """
+        if self._input_manager is not None:
+            self._input_manager.poll()
+
+        now = self._clock()
+        if self._last_time is None:
+            self._last_time = now
+            self._next_render = now
+
+        if self.max_speed:
+            ticks = self._max_ticks_per_step
+            self._accumulator = 0.0
+        else:
+            self._accumulator += now - self._last_time
+            ticks = min(int(self._accumulator / self.tick_time + TICK_EPSILON), self._max_ticks_per_step)
+            self._accumulator -= ticks * self.tick_time
+            # simulation which can not keep up is slowed down instead of spiralling
+            self._accumulator = min(self._accumulator, self.tick_time)
+        self._last_time = now
+
+        if tick_limit is not None:
+            ticks = min(ticks, tick_limit)
+
+        for _ in xrange(ticks):
+            self._engine.tick()
+        self.ticks += ticks
+
+        self._render(self._clock())
+        return ticks
+
+    def _time_to_next_event(self):
+        wait = self.tick_time - self._accumulator
+        if self._renderer is not None and self.render_time is not None:
+            wait = min(wait, self._next_render - self._clock())
+        return wait
+
+    def run(self, max_ticks=None, should_stop=None):
+        while max_ticks is None or self.ticks < max_ticks:
+            if should_stop is not None and should_stop():
+                break
+
+            self.step(None if max_ticks is None else max_ticks - self.ticks)
+
+            if not self.max_speed:
+                wait = self._time_to_next_event()
+                if wait > 0:
+                    self._sleep(wait)
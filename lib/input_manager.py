@@ -0,0 +1,84 @@
+import pygame
+
+import enums
+
+
+class KeyBindings(object):
+    """
+    Keys of one human player. Actions are checked in the order below, the first active one wins.
+    """
+    __slots__ = ('items',)
+
+    def __init__(self, up, left, down, right, shoot):
+        self.items = (
+            (up, enums.Actions.GO_UP),
+            (left, enums.Actions.GO_LEFT),
+            (down, enums.Actions.GO_DOWN),
+            (right, enums.Actions.GO_RIGHT),
+            (shoot, enums.Actions.SHOOT),
+        )
+
+    @classmethod
+    def from_names(cls, up, left, down, right, shoot):
+        """
+        Makes bindings from pygame key names such as 'w', 'up' or 'space'
+        """
+        return cls(*[pygame.key.key_code(name) for name in (up, left, down, right, shoot)])
+
+
+WASD_BINDINGS = KeyBindings(pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d, pygame.K_SPACE)
+ARROW_BINDINGS = KeyBindings(pygame.K_UP, pygame.K_LEFT, pygame.K_DOWN, pygame.K_RIGHT, pygame.K_RCTRL)
+
+
+class InputManager(object):
+    """
+    Pumps pygame event queue once per frame for all human players.
+
+    poll() takes snapshot of held keys and buffers key presses, so a key tapped and released between
+    two polls still counts once. Buffered press of a key is consumed when a player reads the key.
+    Reading bindings consumes presses of all their keys, so a press acts on the next read or never.
+    Works only if pygame was initialized, the event queue must not be read anywhere else.
+    """
+    def __init__(self):
+        self._held = None
+        self._pressed = set()
+        self.quit_requested = False
+
+    def poll(self):
+        for event in pygame.event.get():
+            if event.type == pygame.KEYDOWN:
+                self._pressed.add(event.key)
+            elif event.type == pygame.QUIT:
+                self.quit_requested = True
+
+        self._held = pygame.key.get_pressed()
+
+    def is_active(self, key):
+        """
+        Returns whether key is held or was pressed since it was read last time
+        """
+        pressed = key in self._pressed
+        if pressed:
+            self._pressed.discard(key)
+        return pressed or (self._held is not None and self._held[key])
+
+    def get_action(self, bindings):
+        """
+        Returns action of the first key pressed since the last read, or of the first held key.
+        A fresh press wins over a key which is only held.
+        """
+        pressed_action = None
+        for key, action in bindings.items:
+            if key in self._pressed:
+                self._pressed.discard(key)
+                if pressed_action is None:
+                    pressed_action = action
+
+        if pressed_action is not None:
+            return pressed_action
+
+        if self._held is not None:
+            for key, action in bindings.items:
+                if self._held[key]:
+                    return action
+        return enums.Actions.DO_NOTHING
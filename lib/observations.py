@@ -0,0 +1,159 @@
+import numpy as np
+
+import enums
+from actors import NO_ROW
+from game import static_object_mask
+
+
+class TileObservationBuilder(object):
+    """
+    Builds (channels, map size, map size) uint8 tensor of enums.ObservationChannels from GameState
+    without rendering. Each actor marks map cells its rectangle overlaps.
+    """
+    CHANNELS = len(enums.ObservationChannels)
+
+    def __init__(self, map_size):
+        self.map_size = map_size
+        self.shape = (self.CHANNELS, map_size, map_size)
+        self._coverage = np.zeros((self.CHANNELS, map_size + 1, map_size + 1), dtype=np.int32)
+
+    def build(self, game_state, out=None, focus_actor=None):
+        if out is None:
+            out = np.zeros(self.shape, dtype=np.uint8)
+
+        map = game_state.map
+        out[enums.ObservationChannels.BRICK.value] = static_object_mask(map, enums.StaticObjectTypes.BRICK)
+        out[enums.ObservationChannels.CONCRETE.value] = static_object_mask(map, enums.StaticObjectTypes.CONCRETE)
+
+        coverage = self._coverage
+        coverage[...] = 0
+
+        table = game_state.actor_table
+        rows = table.rows_of(game_state.actors)
+        if rows.size:
+            x, y = table.x[rows], table.y[rows]
+            size = enums.TANK_COLLISION_RECTANGLE[2]
+            channels = enums.ObservationChannels.TANK_UP.value + table.direction[rows]
+            self._add_rects(channels, x, y, size, size)
+
+            bullet_rows = table.bullet[rows]
+            bullet_rows = bullet_rows[bullet_rows != NO_ROW]
+            if bullet_rows.size:
+                direction = table.direction[bullet_rows]
+                channels = np.full(bullet_rows.size, enums.ObservationChannels.BULLET.value)
+                self._add_rects(channels, table.x[bullet_rows], table.y[bullet_rows],
+                                enums.BULLET_RECT_DX[direction], enums.BULLET_RECT_DY[direction])
+
+        rows = table.rows_of(game_state.animations)
+        if rows.size:
+            rows = rows[table.is_dead[rows] == 0]
+            _, _, dx, dy = enums.BULLET_EXPLOSION_ANIMATION_RECT
+            channels = np.full(rows.size, enums.ObservationChannels.EXPLOSION.value)
+            self._add_rects(channels, table.x[rows], table.y[rows], dx, dy)
+
+        if focus_actor is not None:
+            size = enums.TANK_COLLISION_RECTANGLE[2]
+            self._add_rects(np.array([enums.ObservationChannels.FOCUS_TANK.value]),
+                            np.array([focus_actor.x]), np.array([focus_actor.y]), size, size)
+
+        # coverage holds corners of rectangles, cumulative sums turn them into filled areas
+        filled = coverage.cumsum(axis=1).cumsum(axis=2)[:, :-1, :-1]
+        dynamic = slice(enums.ObservationChannels.TANK_UP.value, None)
+        out[dynamic] = filled[dynamic] > 0
+        return out
+
+    def build_batch(self, game_state, actors, out=None):
+        """
+        Observations of many tanks at once, they differ only in FOCUS_TANK channel
+        """
+        if out is None:
+            out = np.empty((len(actors),) + self.shape, dtype=np.uint8)
+
+        out[...] = self.build(game_state)
+
+        size = enums.TANK_COLLISION_RECTANGLE[2]
+        focus = out[:, enums.ObservationChannels.FOCUS_TANK.value]
+        for tank_focus, actor in zip(focus, actors):
+            x, y = actor.x, actor.y
+            tank_focus[max(y / enums.CELL_SIZE, 0): (y + size + enums.CELL_SIZE - 1) / enums.CELL_SIZE,
+                       max(x / enums.CELL_SIZE, 0): (x + size + enums.CELL_SIZE - 1) / enums.CELL_SIZE] = 1
+        return out
+
+    def _add_rects(self, channels, x, y, dx, dy):
+        limit = self.map_size
+        x_min = np.clip(x // enums.CELL_SIZE, 0, limit)
+        y_min = np.clip(y // enums.CELL_SIZE, 0, limit)
+        x_max = np.clip((x + dx + enums.CELL_SIZE - 1) // enums.CELL_SIZE, 0, limit)
+        y_max = np.clip((y + dy + enums.CELL_SIZE - 1) // enums.CELL_SIZE, 0, limit)
+
+        coverage = self._coverage
+        np.add.at(coverage, (channels, y_min, x_min), 1)
+        np.add.at(coverage, (channels, y_min, x_max), -1)
+        np.add.at(coverage, (channels, y_max, x_min), -1)
+        np.add.at(coverage, (channels, y_max, x_max), 1)
+
+
+class FrameStack(object):
+    """
+    Ring buffer of the last depth frames, stacked() returns them as (depth,) + frame shape view without copying.
+
+    Frames are written at increasing slots of a buffer of capacity slots. When it is full the last depth - 1
+    frames are moved to its start, so the stack is always contiguous and the move is amortized over the capacity.
+    Each pushed frame is copied once into its slot, optionally downsampled by an integer factor and converted
+    to grayscale through the palette on the way; frames stay palette indices otherwise. Renderer keeps drawing
+    into its own screen buffer, because it updates the previous frame in place and a slot holds an older one.
+    Stacked views are read-only and change once the buffer wraps, copy them to keep them longer.
+    """
+    GRAYSCALE_WEIGHTS = (0.299, 0.587, 0.114)
+
+    def __init__(self, depth, frame_shape, downsample=1, palette=None, capacity=None, dtype=np.uint8):
+        assert depth >= 1 and downsample >= 1
+
+        self.depth = depth
+        self._downsample = downsample
+        self.frame_shape = tuple(frame_shape[:-2]) + tuple((size + downsample - 1) / downsample
+                                                           for size in frame_shape[-2:])
+
+        self._lookup = None
+        if palette is not None:
+            rgb = np.asarray(palette, dtype=np.float64).reshape(-1, 3)
+            self._lookup = np.zeros(256, dtype=np.uint8)
+            self._lookup[:len(rgb)] = np.round(rgb.dot(self.GRAYSCALE_WEIGHTS))
+
+        capacity = max(capacity if capacity is not None else depth * 8, depth)
+        self._frames = np.zeros((capacity,) + self.frame_shape, dtype=dtype)
+        self.reset()
+
+    @property
+    def shape(self):
+        return (self.depth,) + self.frame_shape
+
+    def reset(self):
+        """
+        Fills stack with empty frames
+        """
+        self._frames[:self.depth] = 0
+        self._end = self.depth
+
+    def push(self, frame):
+        if self._end == len(self._frames):
+            keep = self.depth - 1
+            self._frames[:keep] = self._frames[self._end - keep: self._end]
+            self._end = keep
+
+        slot = self._frames[self._end]
+        if self._downsample > 1:
+            frame = frame[..., ::self._downsample, ::self._downsample]
+
+        if self._lookup is not None:
+            np.take(self._lookup, frame, out=slot, mode='clip')
+        else:
+            np.copyto(slot, frame)
+
+        self._end += 1
+        return self.stacked()
+
+    def stacked(self):
+        view = self._frames[self._end - self.depth: self._end]
+        view.flags.writeable = False
+        return view
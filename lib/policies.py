@@ -0,0 +1,42 @@
+import numpy as np
+
+from game import MapBuilder
+from observations import TileObservationBuilder
+
+
+class BatchPolicy(object):
+    """
+    Chooses actions of all PolicyPlayer tanks which share it with one call per tick.
+    Subclasses build observation batch in observe() and run inference on it in act().
+    """
+    def observe(self, game_state, actors):
+        raise NotImplementedError
+
+    def act(self, observations):
+        """
+        Returns sequence of enums.Actions or their values, one per observation
+        """
+        raise NotImplementedError
+
+    def __call__(self, game_state, actors):
+        return self.act(self.observe(game_state, actors))
+
+
+class TilePolicy(BatchPolicy):
+    """
+    Runs model on (tanks, channels, map size, map size) batch of tile observations, each focused
+    on its own tank. Observation buffer is reused between ticks, model must not keep it.
+    """
+    def __init__(self, model):
+        self._model = model
+        self._builder = TileObservationBuilder(MapBuilder.MAP_SIZE)
+        self._observations = np.zeros((0,) + self._builder.shape, dtype=np.uint8)
+
+    def observe(self, game_state, actors):
+        if len(self._observations) < len(actors):
+            self._observations = np.empty((len(actors),) + self._builder.shape, dtype=np.uint8)
+        return self._builder.build_batch(game_state, actors, out=self._observations[:len(actors)])
+
+    def act(self, observations):
+        return self._model(observations)
+
@@ -0,0 +1,107 @@
+import timeit
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class InstrumentedProxy(object):
+    """
+    Stands in for an object or class, instrumented methods are set as attributes of the proxy
+    """
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class PhaseProfiler(object):
+    """
+    Collects wall time and call counts of instrumented phases.
+
+    Objects are instrumented by replacing their methods with timed wrappers, so nothing is
+    measured (and nothing is paid) until set_profiler is called on engine or renderer.
+    Call end_frame() once per frame: it closes per-frame counters, stores them in a rolling
+    window and passes them to registered hooks.
+    """
+    def __init__(self, window=300, timer=timeit.default_timer):
+        self._timer = timer
+        self._calls = defaultdict(int)
+        self._times = defaultdict(float)
+        self._frames = deque(maxlen=window)
+        self._hooks = []
+
+    def wrap(self, phase, function):
+        timer = self._timer
+        calls = self._calls
+        times = self._times
+
+        def timed(*args, **kwargs):
+            start = timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[phase] += timer() - start
+                calls[phase] += 1
+
+        return timed
+
+    def instrument(self, obj, methods, prefix):
+        """
+        Replaces methods of object instance with timed wrappers. Phases are named prefix.method
+        """
+        for name in methods:
+            setattr(obj, name, self.wrap(prefix + '.' + name.lstrip('_'), getattr(obj, name)))
+        return obj
+
+    @staticmethod
+    def uninstrument(obj, methods):
+        for name in methods:
+            obj.__dict__.pop(name, None)
+
+    def add_hook(self, hook):
+        """
+        Hook is called with {phase: (calls, seconds)} dict at the end of every frame
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def end_frame(self):
+        frame = dict((phase, (self._calls[phase], self._times[phase])) for phase in self._calls)
+        self._calls.clear()
+        self._times.clear()
+
+        self._frames.append(frame)
+        for hook in self._hooks:
+            hook(frame)
+        return frame
+
+    def reset(self):
+        self._calls.clear()
+        self._times.clear()
+        self._frames.clear()
+
+    def export(self):
+        """
+        Rolling statistics over the stored frames, times are in milliseconds
+        """
+        phases = set()
+        for frame in self._frames:
+            phases.update(frame)
+
+        stats = {}
+        for phase in sorted(phases):
+            calls = np.array([frame.get(phase, (0, 0.0))[0] for frame in self._frames])
+            times = np.array([frame.get(phase, (0, 0.0))[1] for frame in self._frames]) * 1e3
+            stats[phase] = {
+                'calls_per_frame': calls.mean(),
+                'mean_ms': times.mean(),
+                'p50_ms': np.percentile(times, 50),
+                'p99_ms': np.percentile(times, 99),
+                'max_ms': times.max(),
+                'total_ms': times.sum(),
+            }
+
+        return {'frames': len(self._frames), 'phases': stats}
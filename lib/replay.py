@@ -0,0 +1,190 @@
+"""
+Matches are recorded as initial state, one action value per tank per tick and periodic keyframes.
+GameEngine is deterministic, so a replay re-simulates the match exactly and keyframes only serve seeking
+and divergence checks.
+"""
+import bisect
+
+import numpy as np
+
+import enums
+from actors import ExternalPlayer
+from game import GameState, GameEngine, GameSnapshot, CollisionIndex
+
+NO_SEED = -1
+
+
+class ReplayDivergedError(Exception):
+    pass
+
+
+class Replay(object):
+    """
+    Recorded match. actions is (ticks, tanks) uint8 array of enums.Actions values,
+    keyframes are GameSnapshots of state after keyframe_ticks ticks, the first one is the initial state.
+    """
+    def __init__(self, tank_sprites, actions, keyframe_ticks, keyframes, seed=None):
+        assert keyframe_ticks and keyframe_ticks[0] == 0
+
+        self.tank_sprites = list(tank_sprites)
+        self.actions = actions
+        self.keyframe_ticks = list(keyframe_ticks)
+        self.keyframes = list(keyframes)
+        self.seed = seed
+
+    @property
+    def map(self):
+        return self.keyframes[0].map
+
+    @property
+    def ticks(self):
+        return len(self.actions)
+
+    def save(self, path):
+        """
+        Writes compressed npz file, collision integrals are rebuilt on load
+        """
+        animations = [keyframe.animations for keyframe in self.keyframes]
+        np.savez_compressed(
+            path,
+            seed=np.array(NO_SEED if self.seed is None else self.seed),
+            tank_sprites=np.array([sprite.value for sprite in self.tank_sprites], dtype=np.uint8),
+            actions=self.actions,
+            keyframe_ticks=np.array(self.keyframe_ticks, dtype=np.int64),
+            keyframe_maps=np.array([keyframe.map for keyframe in self.keyframes]),
+            keyframe_actors=np.array([keyframe.actors for keyframe in self.keyframes]),
+            keyframe_animations=np.concatenate(animations),
+            keyframe_animation_counts=np.array([len(a) for a in animations], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            data = dict(data.items())
+
+        offsets = np.concatenate(([0], np.cumsum(data['keyframe_animation_counts'])))
+        animations = data['keyframe_animations']
+
+        keyframes = []
+        for i, (map, actors) in enumerate(zip(data['keyframe_maps'], data['keyframe_actors'])):
+            integral = CollisionIndex(map).get_integral()
+            keyframes.append(GameSnapshot(map, integral, actors, animations[offsets[i]: offsets[i + 1]]))
+
+        seed = int(data['seed'])
+        return cls([enums.ActorSpriteEnum(value) for value in data['tank_sprites'].tolist()],
+                   data['actions'], data['keyframe_ticks'].tolist(), keyframes,
+                   seed=None if seed == NO_SEED else seed)
+
+
+class MatchRecorder(object):
+    """
+    Records match played by engine from the current state of its game:
+
+        recorder = MatchRecorder(game_state, seed=seed)
+        engine.set_recorder(recorder)
+        ...
+        recorder.get_replay().save(path)
+
+    Tanks must not be added during recording.
+    """
+    def __init__(self, game_state, seed=None, keyframe_interval=600, capacity=4096):
+        self._game_state = game_state
+        self._seed = seed
+        self._keyframe_interval = keyframe_interval
+
+        self._tank_sprites = [actor.sprite for actor in game_state.actors]
+        self._actions = np.zeros((capacity, len(self._tank_sprites)), dtype=np.uint8)
+        self.ticks = 0
+
+        self._keyframe_ticks = [0]
+        self._keyframes = [game_state.snapshot()]
+
+    def record_tick(self, actions):
+        if self.ticks == len(self._actions):
+            self._actions = np.concatenate((self._actions, np.zeros_like(self._actions)))
+
+        self._actions[self.ticks] = actions
+        self.ticks += 1
+
+        if self.ticks % self._keyframe_interval == 0:
+            self._keyframe_ticks.append(self.ticks)
+            self._keyframes.append(self._game_state.snapshot())
+
+    def get_replay(self):
+        return Replay(self._tank_sprites, self._actions[:self.ticks].copy(), self._keyframe_ticks,
+                      self._keyframes, seed=self._seed)
+
+
+class ReplayPlayer(object):
+    """
+    Re-simulates recorded match as fast as possible, rendering is optional.
+    With verify keyframes passed during playback are compared with the simulated state.
+    """
+    def __init__(self, replay, renderer=None, verify=False):
+        self._replay = replay
+        self._renderer = renderer
+        self._verify = verify
+
+        self.game_state = GameState(replay.map.copy())
+        self.tanks = [ExternalPlayer(0, 0, sprite) for sprite in replay.tank_sprites]
+        for tank in self.tanks:
+            self.game_state.add_actor(tank)
+
+        self._engine = GameEngine(self.game_state)
+        self._engine.set_renderer(renderer)
+        self.tick = 0
+        self._restore_keyframe(0)
+
+    @property
+    def done(self):
+        return self.tick >= self._replay.ticks
+
+    def _restore_keyframe(self, index):
+        self.game_state.restore(self._replay.keyframes[index])
+        self.tick = self._replay.keyframe_ticks[index]
+        if self._renderer is not None:
+            self._renderer.set_game_state(self.game_state)
+
+    def step(self):
+        for tank, action in zip(self.tanks, self._replay.actions[self.tick].tolist()):
+            tank.action = enums.Actions(action)
+
+        self._engine.tick()
+        self.tick += 1
+
+        if self._verify:
+            self._check_keyframe()
+
+    def _check_keyframe(self):
+        index = bisect.bisect_left(self._replay.keyframe_ticks, self.tick)
+        if index == len(self._replay.keyframe_ticks) or self._replay.keyframe_ticks[index] != self.tick:
+            return
+
+        expected = self._replay.keyframes[index]
+        state = self.game_state.snapshot()
+        for name in GameSnapshot.__slots__:
+            if not np.array_equal(getattr(state, name), getattr(expected, name)):
+                raise ReplayDivergedError('Replay diverged from keyframe at tick %d in %s' % (self.tick, name))
+
+    def seek(self, tick):
+        """
+        Restores the last keyframe before tick and simulates the rest
+        """
+        assert 0 <= tick <= self._replay.ticks
+
+        index = bisect.bisect_right(self._replay.keyframe_ticks, tick) - 1
+        if tick < self.tick or self._replay.keyframe_ticks[index] > self.tick:
+            self._restore_keyframe(index)
+
+        while self.tick < tick:
+            self.step()
+
+    def run(self, ticks=None):
+        """
+        Plays given number of ticks or the rest of the match, returns number of ticks played
+        """
+        end = self._replay.ticks if ticks is None else min(self.tick + ticks, self._replay.ticks)
+        start = self.tick
+        while self.tick < end:
+            self.step()
+        return end - start
@@ -0,0 +1,109 @@
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+
+from environment import TankEnvironment
+from game import NumpyScreen, Renderer
+
+
+def _shared_array(shape, dtype):
+    dtype = np.dtype(dtype)
+    raw = RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    return raw, np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _worker(connection, env_indices, observations, rewards, dones, env_kwargs):
+    envs = [TankEnvironment(screen=NumpyScreen(buffer=observations[i]), **env_kwargs) for i in env_indices]
+
+    while True:
+        command, data = connection.recv()
+
+        if command == 'reset':
+            for env, seed in zip(envs, data):
+                env.reset(seed)
+            connection.send(None)
+
+        elif command == 'step':
+            infos = []
+            for env, i, action in zip(envs, env_indices, data):
+                _, rewards[i], dones[i], info = env.step(action)
+                if dones[i]:
+                    env.reset()
+                infos.append(info)
+            connection.send(infos)
+
+        elif command == 'close':
+            connection.close()
+            break
+
+
+class ParallelRollouts(object):
+    """
+    Runs TankEnvironments in worker processes. Workers render observations straight into
+    shared memory, only actions and small info dicts go through pipes.
+
+    Arrays returned by reset() and step() are views of shared buffers, they are overwritten
+    by the next call. Environments which are done are reset automatically, the returned
+    observation then belongs to the new episode.
+
+    Only plain 'pixels' observations are supported, they are what workers render into shared memory.
+    """
+    def __init__(self, num_workers, envs_per_worker, **env_kwargs):
+        assert env_kwargs.get('observation_type', 'pixels') == 'pixels'
+        assert not set(env_kwargs) & {'frame_stack', 'downsample', 'grayscale', 'screen'}
+
+        self.num_envs = num_workers * envs_per_worker
+        size = Renderer.get_screen_size(env_kwargs.get('scale', 1))
+
+        self._raw_buffers = [
+            _shared_array((self.num_envs, size, size), np.uint8),
+            _shared_array((self.num_envs,), np.int32),
+            _shared_array((self.num_envs,), np.bool_),
+        ]
+        self.observations, self.rewards, self.dones = [array for _, array in self._raw_buffers]
+
+        self._connections = []
+        self._workers = []
+        for worker_index in xrange(num_workers):
+            env_indices = range(worker_index * envs_per_worker, (worker_index + 1) * envs_per_worker)
+            parent_connection, child_connection = multiprocessing.Pipe()
+
+            worker = multiprocessing.Process(target=_worker,
+                                             args=(child_connection, env_indices, self.observations,
+                                                   self.rewards, self.dones, env_kwargs))
+            worker.daemon = True
+            worker.start()
+            child_connection.close()
+
+            self._connections.append((parent_connection, env_indices))
+            self._workers.append(worker)
+
+    def reset(self, seeds=None):
+        if seeds is None:
+            seeds = [None] * self.num_envs
+
+        for connection, env_indices in self._connections:
+            connection.send(('reset', [seeds[i] for i in env_indices]))
+        for connection, _ in self._connections:
+            connection.recv()
+
+        return self.observations
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int32)
+
+        for connection, env_indices in self._connections:
+            connection.send(('step', actions[env_indices[0]: env_indices[-1] + 1].tolist()))
+
+        infos = []
+        for connection, _ in self._connections:
+            infos.extend(connection.recv())
+
+        return self.observations, self.rewards, self.dones, infos
+
+    def close(self):
+        for connection, _ in self._connections:
+            connection.send(('close', None))
+        for worker in self._workers:
+            worker.join()
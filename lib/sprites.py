@@ -1,14 +1,35 @@
+import hashlib
+import json
+import os
+
 import numpy as np
 from PIL import Image
 
 
 import enums
 
+ATLAS_VERSION = 1
+
 
 def scale_up_sprite(sprite, scale):
     return np.kron(sprite, np.ones((scale, scale), dtype=np.uint8))
 
 
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def replace_file(path, write):
+    """
+    Writes file under temporary name and renames it, so concurrent readers never see partial file
+    """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.rename(tmp_path, path)
+
+
 class SpriteStorage(object):
     TILE_SIZE = 16
     STATIC_OBJECT_PART_SIZE = 4
@@ -31,14 +52,100 @@ class SpriteStorage(object):
         enums.ShotAnimationSprites.THIRD_FRAME: (18, 8)
     }
 
-    def __init__(self, sprite_file, scale):
+    def __init__(self, sprite_file, scale, cache_dir=None):
+        """
+        With cache_dir sprites are stored in an atlas file per source image and scale,
+        later instances memory-map it instead of decoding and rescaling the sprite sheet
+        """
         self.palette = None
         self._player_sprites = {}
         self._bullet_sprites = {}
         self._animation_sprites = {}
+        self._static_object_sprites = None
 
         self._scale = scale
+        if cache_dir is None:
+            self._load_sprites(sprite_file)
+        else:
+            self._load_cached_sprites(sprite_file, cache_dir)
+
+    def _get_atlas_path(self, sprite_file, cache_dir):
+        name = os.path.splitext(os.path.basename(sprite_file))[0]
+        return os.path.join(cache_dir, '%s-%s-x%d-v%d' % (name, file_digest(sprite_file)[:16],
+                                                          self._scale, ATLAS_VERSION))
+
+    def _load_cached_sprites(self, sprite_file, cache_dir):
+        atlas_path = self._get_atlas_path(sprite_file, cache_dir)
+        try:
+            self._load_atlas(atlas_path)
+            return
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
         self._load_sprites(sprite_file)
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            self._save_atlas(atlas_path)
+        except (IOError, OSError):
+            pass
+
+    def _iter_atlas_entries(self):
+        for (sprite, direction, step_cycle), array in self._player_sprites.items():
+            yield ('player', sprite.name, direction.name, step_cycle.name), array
+
+        for direction, array in self._bullet_sprites.items():
+            yield ('bullet', direction.name), array
+
+        for sprite, array in self._animation_sprites.items():
+            yield ('animation', sprite.name), array
+
+        yield ('static',), self._static_object_sprites
+
+    def _save_atlas(self, path):
+        entries = []
+        arrays = []
+        offset = 0
+        for key, array in self._iter_atlas_entries():
+            entries.append([list(key), offset, list(array.shape)])
+            arrays.append(array.ravel())
+            offset += array.size
+
+        index = {
+            'version': ATLAS_VERSION,
+            'scale': self._scale,
+            'palette': list(self.palette),
+            'sprites': entries
+        }
+
+        data = np.concatenate(arrays)
+        replace_file(path + '.npy', lambda f: np.save(f, data))
+        replace_file(path + '.json', lambda f: json.dump(index, f))
+
+    def _load_atlas(self, path):
+        with open(path + '.json') as f:
+            index = json.load(f)
+        if index['version'] != ATLAS_VERSION or index['scale'] != self._scale:
+            raise ValueError('Atlas %s does not match storage' % path)
+
+        data = np.load(path + '.npy', mmap_mode='r')
+
+        for key, offset, shape in index['sprites']:
+            array = data[offset: offset + int(np.prod(shape))].reshape(shape)
+            kind = key[0]
+
+            if kind == 'player':
+                sprite_key = (enums.ActorSpriteEnum[key[1]], enums.ActorDirections[key[2]],
+                              enums.TankAnimationCycle[key[3]])
+                self._player_sprites[sprite_key] = array
+            elif kind == 'bullet':
+                self._bullet_sprites[enums.ActorDirections[key[1]]] = array
+            elif kind == 'animation':
+                self._animation_sprites[enums.ShotAnimationSprites[key[1]]] = array
+            elif kind == 'static':
+                self._static_object_sprites = array
+
+        self.palette = index['palette']
 
     def _load_sprites(self, sprite_file):
         im = Image.open(sprite_file)
@@ -118,6 +225,19 @@ class SpriteStorage(object):
             sprite_rect = (x_offset, y_offset, self.TILE_SIZE, self.TILE_SIZE)
             self._animation_sprites[sprite] = self._crop_sprite_and_rescale(sprite_rect, sprite_array)
 
+    def iter_sprites(self):
+        for sprite in self._player_sprites.values():
+            yield sprite
+
+        for sprite in self._bullet_sprites.values():
+            yield sprite
+
+        for sprite in self._static_object_sprites:
+            yield sprite
+
+        for sprite in self._animation_sprites.values():
+            yield sprite
+
     def array_to_img(self, img):
         img = Image.fromarray(img)
         img.putpalette(self.palette)
@@ -132,6 +252,13 @@ class SpriteStorage(object):
     def get_static_object_sprite(self, index):
         return self._static_object_sprites[index]
 
+    def get_static_object_tiles(self):
+        """
+        Static object sprites indexed by map value, index 0 is empty tile
+        """
+        empty = np.zeros((1,) + self._static_object_sprites.shape[1:], dtype=np.uint8)
+        return np.concatenate((empty, self._static_object_sprites))
+
     def get_animation_sprite(self, animation):
         return self._animation_sprites[animation.sprite]
 
@@ -0,0 +1,146 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+from actors import TankActor
+from game import GameState, Renderer
+
+
+class FrameBuffer(object):
+    """
+    State of one tick captured for rendering
+    """
+    __slots__ = ('snapshot', 'tank_sprites')
+
+    def __init__(self):
+        self.snapshot = None
+        self.tank_sprites = []
+
+
+class ThreadedRenderer(object):
+    """
+    Draws game on a worker thread, so slow presentation never stalls the simulation.
+
+    render() captures the game state into one of two frame buffers and publishes it, present() does nothing,
+    so the object stands in for Renderer in GameLoop. The worker restores the newest published buffer into
+    its own mirror of the game state and draws it with a regular Renderer.
+
+    Buffers are handed over with atomic deque operations and no locks. The worker owns at most one buffer while
+    drawing it, the other one is written and republished: a frame which was not picked up in time is replaced
+    by the newer one and counted in frames_dropped.
+
+    Screen is used from the worker thread, pygame display has to support that on the platform.
+    """
+    def __init__(self, game_state, screen, scale=4, join_timeout=5.0):
+        self._game_state = game_state
+        self._mirror = GameState(game_state.map.copy())
+        self._renderer = Renderer(self._mirror, screen, scale, clear_actors=True)
+        self.size = self._renderer.size
+
+        self._free = deque([FrameBuffer(), FrameBuffer()])
+        self._ready = deque()
+        self._wake = threading.Event()
+
+        self._join_timeout = join_timeout
+        self._thread = None
+        self._running = False
+        self._error = None
+
+        self.frames_published = 0
+        self.frames_dropped = 0
+        self.frames_rendered = 0
+
+    def set_game_state(self, game_state):
+        """
+        Switches to another game, has to be called while the worker is stopped
+        """
+        assert self._thread is None
+        self._game_state = game_state
+        self._mirror = GameState(game_state.map.copy())
+        self._renderer.set_game_state(self._mirror)
+
+    def start(self):
+        if self._thread is not None:
+            return self
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='renderer')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._running = False
+        self._wake.set()
+        self._thread.join(self._join_timeout)
+        self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def render(self):
+        """
+        Publishes current game state for drawing, never waits for the worker
+        """
+        self._raise_error()
+
+        try:
+            frame = self._ready.popleft()
+            self.frames_dropped += 1
+        except IndexError:
+            frame = self._free.popleft()
+
+        game_state = self._game_state
+        frame.snapshot = game_state.snapshot(out=frame.snapshot)
+        if len(frame.tank_sprites) != len(game_state.actors):
+            frame.tank_sprites = [actor.sprite for actor in game_state.actors]
+
+        self._ready.append(frame)
+        self.frames_published += 1
+        self._wake.set()
+
+    def present(self):
+        pass
+
+    def _run(self):
+        try:
+            while self._running:
+                self._wake.wait()
+                self._wake.clear()
+
+                try:
+                    frame = self._ready.popleft()
+                except IndexError:
+                    continue
+
+                try:
+                    self._draw(frame)
+                finally:
+                    self._free.append(frame)
+        except Exception as error:
+            self._error = error
+
+    def _draw(self, frame):
+        mirror = self._mirror
+        snapshot = frame.snapshot
+
+        for sprite in frame.tank_sprites[len(mirror.actors):]:
+            mirror.add_actor(TankActor(0, 0, sprite))
+
+        changed_y, changed_x = np.nonzero(snapshot.map != mirror.map)
+        mirror.restore(snapshot)
+
+        if changed_x.size:
+            x_min, y_min = changed_x.min(), changed_y.min()
+            self._renderer.update_bg((x_min, y_min, changed_x.max() + 1 - x_min, changed_y.max() + 1 - y_min))
+
+        self._renderer.render()
+        self._renderer.present()
+        self.frames_rendered += 1
@@ -0,0 +1,222 @@
+"""
+On-disk store of (observation, action, reward, done) steps for experience replay.
+
+Steps are appended into chunks of preallocated memory-mapped .npy files, one file per field, so the store is
+not limited by RAM. Index file lists chunks with their committed sizes and is replaced atomically on commit,
+readers in other processes see only committed steps and never load whole files.
+"""
+import json
+import os
+
+import numpy as np
+
+from game import GameSnapshot, MapBuilder
+from sprites import replace_file
+
+INDEX_FILE = 'index.json'
+STORE_VERSION = 1
+
+STEP_FIELDS = {
+    'action': ((), 'uint8'),
+    'reward': ((), 'float32'),
+    'done': ((), 'bool'),
+}
+
+
+def frame_spec(shape):
+    """
+    Observation spec of palette-index frames
+    """
+    return {'frame': (tuple(shape), 'uint8')}
+
+
+def state_spec(max_tanks):
+    """
+    Observation spec of map with tank rows of GameSnapshot, padded to max_tanks
+    """
+    return {
+        'map': ((MapBuilder.MAP_SIZE, MapBuilder.MAP_SIZE), 'uint8'),
+        'tanks': ((max_tanks, GameSnapshot.ACTOR_COLUMNS), 'int32'),
+        'tank_count': ((), 'int32'),
+    }
+
+
+def get_state_observation(game_state, max_tanks):
+    snapshot = game_state.snapshot()
+    count = len(snapshot.actors)
+    assert count <= max_tanks
+
+    tanks = np.zeros((max_tanks, GameSnapshot.ACTOR_COLUMNS), dtype=np.int32)
+    tanks[:count] = snapshot.actors
+    return {'map': snapshot.map, 'tanks': tanks, 'tank_count': count}
+
+
+def _chunk_name(index):
+    return 'chunk-%06d' % index
+
+
+def _field_path(directory, chunk, field):
+    return os.path.join(directory, chunk, field + '.npy')
+
+
+class TrajectoryWriter(object):
+    """
+    Appends steps to the store in directory, continuing after already committed steps.
+    Observation spec maps field names to (shape, dtype), observations are dicts of these fields
+    or plain arrays for single field specs. Steps become visible to readers on commit,
+    which happens every commit_interval steps, on chunk rollover and on close.
+    """
+    def __init__(self, directory, observation_spec, chunk_size=65536, commit_interval=1024):
+        self._directory = directory
+        self._fields = dict(STEP_FIELDS)
+        self._fields.update(observation_spec)
+        self._observation_fields = sorted(observation_spec)
+        self._commit_interval = commit_interval
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self._index = json.load(f)
+            if self._index['fields'] != self._get_field_index():
+                raise ValueError('Trajectory store %s has different fields' % directory)
+        else:
+            self._index = {
+                'version': STORE_VERSION,
+                'chunk_size': chunk_size,
+                'fields': self._get_field_index(),
+                'chunks': []
+            }
+
+        self.chunk_size = self._index['chunk_size']
+        self._arrays = None
+        self._size = 0
+        self._committed = 0
+
+        chunks = self._index['chunks']
+        if chunks and chunks[-1]['size'] < self.chunk_size:
+            self._open_chunk(chunks[-1]['name'], 'r+')
+            self._size = self._committed = chunks[-1]['size']
+
+    def _get_field_index(self):
+        return dict((name, [list(shape), np.dtype(dtype).str]) for name, (shape, dtype) in self._fields.items())
+
+    def _open_chunk(self, name, mode):
+        if mode == 'w+':
+            os.makedirs(os.path.join(self._directory, name))
+
+        self._arrays = {}
+        for field, (shape, dtype) in self._fields.items():
+            self._arrays[field] = np.lib.format.open_memmap(_field_path(self._directory, name, field), mode=mode,
+                                                            dtype=dtype, shape=(self.chunk_size,) + tuple(shape))
+
+    def _new_chunk(self):
+        name = _chunk_name(len(self._index['chunks']))
+        self._open_chunk(name, 'w+')
+        self._index['chunks'].append({'name': name, 'size': 0})
+        self._size = self._committed = 0
+
+    def append(self, observation, action, reward, done):
+        if self._arrays is None or self._size == self.chunk_size:
+            if self._arrays is not None:
+                self.commit()
+            self._new_chunk()
+
+        if not isinstance(observation, dict):
+            observation = {self._observation_fields[0]: observation}
+
+        row = self._size
+        for field in self._observation_fields:
+            self._arrays[field][row] = observation[field]
+        self._arrays['action'][row] = getattr(action, 'value', action)
+        self._arrays['reward'][row] = reward
+        self._arrays['done'][row] = done
+        self._size += 1
+
+        if self._size == self.chunk_size or self._size - self._committed >= self._commit_interval:
+            self.commit()
+
+    def commit(self):
+        """
+        Flushes appended steps to disk and publishes them to readers
+        """
+        if self._arrays is None or self._size == self._committed:
+            return
+
+        for array in self._arrays.values():
+            array.flush()
+
+        self._index['chunks'][-1]['size'] = self._size
+        replace_file(os.path.join(self._directory, INDEX_FILE), lambda f: json.dump(self._index, f))
+        self._committed = self._size
+
+    def close(self):
+        self.commit()
+        self._arrays = None
+
+
+class TrajectoryReader(object):
+    """
+    Random access to committed steps of a store, chunk files are memory-mapped read-only on first use.
+    Call refresh() to see steps committed by the writer since opening.
+    """
+    def __init__(self, directory):
+        self._directory = directory
+        self._chunks = {}
+        self._sizes = []
+        self.fields = None
+        self.chunk_size = None
+        self.refresh()
+
+    def refresh(self):
+        with open(os.path.join(self._directory, INDEX_FILE)) as f:
+            index = json.load(f)
+
+        self.fields = dict((name, (tuple(shape), np.dtype(dtype))) for name, (shape, dtype) in index['fields'].items())
+        self.chunk_size = index['chunk_size']
+        self._names = [chunk['name'] for chunk in index['chunks']]
+        self._sizes = [chunk['size'] for chunk in index['chunks']]
+        return self
+
+    def __len__(self):
+        return sum(self._sizes)
+
+    def _get_chunk(self, chunk):
+        arrays = self._chunks.get(chunk)
+        if arrays is None:
+            name = self._names[chunk]
+            arrays = self._chunks[chunk] = dict(
+                (field, np.load(_field_path(self._directory, name, field), mmap_mode='r')) for field in self.fields)
+        return arrays
+
+    def _locate(self, indices):
+        """
+        Maps step indices to chunks and rows, all chunks but the last one are full
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.size and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError('Step index out of range')
+        return indices // self.chunk_size, indices % self.chunk_size
+
+    def get(self, indices):
+        """
+        Returns dict of field arrays for given step indices
+        """
+        chunks, rows = self._locate(indices)
+        batch = dict((field, np.empty((len(rows),) + shape, dtype=dtype))
+                     for field, (shape, dtype) in self.fields.items())
+
+        for chunk in np.unique(chunks).tolist():
+            selected = np.flatnonzero(chunks == chunk)
+            arrays = self._get_chunk(chunk)
+            for field, array in arrays.items():
+                batch[field][selected] = array[rows[selected]]
+        return batch
+
+    def sample(self, batch_size, random_state=np.random):
+        indices = random_state.randint(len(self), size=batch_size)
+        batch = self.get(indices)
+        batch['index'] = indices
+        return batch
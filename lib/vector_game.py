@@ -0,0 +1,245 @@
+import numpy as np
+
+import enums
+from game import GameState, MapBuilder, STATIC_SPRITE_TYPE_COUNT, static_object_mask
+
+MAP_SIZE = MapBuilder.MAP_SIZE
+BOARD_SIZE = GameState.BOARD_SIZE
+
+TANK_SIZE = enums.TANK_COLLISION_RECTANGLE[2]
+TANK_SPEED = 1
+BULLET_SPEED = 2
+
+ANIMATION_FRAMES = len(enums.ShotAnimationSprites)
+ANIMATION_DELAY = 3
+ANIMATION_LIFETIME = ANIMATION_FRAMES * ANIMATION_DELAY
+
+
+class VectorGameEngine(object):
+    """
+    Headless engine which advances N independent single-tank games in lockstep.
+
+    Every game is stored as a row of stacked NumPy arrays and step() applies one
+    action per game with whole-array operations. The rules follow GameEngine.tick:
+    the tank moves, its bullet advances and collides, then a new bullet may be fired.
+    """
+    ANIMATION_SLOTS = 24
+
+    def __init__(self, maps, tank_x, tank_y, tank_sprites=None):
+        self.maps = np.array(maps, dtype=np.uint8)
+        assert self.maps.ndim == 3 and self.maps.shape[1:] == (MAP_SIZE, MAP_SIZE)
+
+        self.size = self.maps.shape[0]
+        n = self.size
+
+        self.tank_x = np.array(tank_x, dtype=np.int32).reshape(n)
+        self.tank_y = np.array(tank_y, dtype=np.int32).reshape(n)
+        self.tank_direction = np.full(n, enums.ActorDirections.UP.value, dtype=np.int32)
+        self.tank_step_cycle = np.full(n, enums.TankAnimationCycle.FIRST.value, dtype=np.int32)
+        self.tank_step_counter = np.zeros(n, dtype=np.int32)
+
+        if tank_sprites is None:
+            tank_sprites = [enums.ActorSpriteEnum.PLAYER_1_TANK] * n
+        self.tank_sprites = list(tank_sprites)
+
+        self.bullet_alive = np.zeros(n, dtype=np.bool_)
+        self.bullet_x = np.zeros(n, dtype=np.int32)
+        self.bullet_y = np.zeros(n, dtype=np.int32)
+        self.bullet_direction = np.zeros(n, dtype=np.int32)
+
+        self.animation_alive = np.zeros((n, self.ANIMATION_SLOTS), dtype=np.bool_)
+        self.animation_counter = np.zeros((n, self.ANIMATION_SLOTS), dtype=np.int32)
+        self.animation_x = np.zeros((n, self.ANIMATION_SLOTS), dtype=np.int32)
+        self.animation_y = np.zeros((n, self.ANIMATION_SLOTS), dtype=np.int32)
+
+        self._games = np.arange(n)
+
+    @classmethod
+    def from_game_states(cls, game_states):
+        """
+        Builds the engine from GameStates holding exactly one tank each
+        """
+        tanks = []
+        for game_state in game_states:
+            assert len(game_state.actors) == 1
+            tanks.append(game_state.actors[0])
+
+        engine = cls([s.map for s in game_states],
+                     [t.x for t in tanks],
+                     [t.y for t in tanks],
+                     [t.sprite for t in tanks])
+
+        engine.tank_direction[:] = [t.direction.value for t in tanks]
+        engine.tank_step_cycle[:] = [t.step_cycle.value for t in tanks]
+        engine.tank_step_counter[:] = [t._step_counter for t in tanks]
+        return engine
+
+    def step(self, actions):
+        """
+        Advances every game by one tick.
+
+        :param actions: (N,) integer array of enums.Actions values
+        """
+        actions = np.asarray(actions, dtype=np.int32).reshape(self.size)
+
+        self._tick_animations()
+
+        moving = actions < 4
+        self._move_tanks(moving, actions)
+
+        self._move_bullets(self.bullet_alive.copy())
+
+        shooting = (actions == enums.ACTION_SHOOT) & ~self.bullet_alive
+        self._fire_bullets(shooting)
+
+    def _tick_animations(self):
+        self.animation_alive &= self.animation_counter < ANIMATION_LIFETIME
+        self.animation_counter += self.animation_alive
+
+    def animation_frames(self):
+        """
+        Returns (N, ANIMATION_SLOTS) sprite frame indices, -1 for empty or finished slots
+        """
+        visible = self.animation_alive & (self.animation_counter < ANIMATION_LIFETIME)
+        return np.where(visible, self.animation_counter // ANIMATION_DELAY, -1)
+
+    def _move_tanks(self, moving, actions):
+        games = self._games[moving]
+        if games.size == 0:
+            return
+
+        direction = actions[games]
+        self.tank_direction[games] = direction
+
+        new_x = self.tank_x[games] + enums.DIRECTION_DX[direction] * TANK_SPEED
+        new_y = self.tank_y[games] + enums.DIRECTION_DY[direction] * TANK_SPEED
+
+        size = np.full(games.size, TANK_SIZE, dtype=np.int32)
+        in_bounds = self._in_bounds(new_x, new_y, size, size)
+        can_move = in_bounds & self._is_free(games, new_x, new_y, size, size, in_bounds)
+
+        self.tank_x[games] = np.where(can_move, new_x, self.tank_x[games])
+        self.tank_y[games] = np.where(can_move, new_y, self.tank_y[games])
+
+        counter = (self.tank_step_counter[games] + 1) % 3
+        self.tank_step_counter[games] = counter
+        flip = games[counter == 0]
+        self.tank_step_cycle[flip] = 1 - self.tank_step_cycle[flip]
+
+    def _move_bullets(self, alive):
+        games = self._games[alive]
+        if games.size == 0:
+            return
+
+        direction = self.bullet_direction[games]
+        new_x = self.bullet_x[games] + enums.DIRECTION_DX[direction] * BULLET_SPEED
+        new_y = self.bullet_y[games] + enums.DIRECTION_DY[direction] * BULLET_SPEED
+
+        can_move = self._collide_bullets(games, new_x, new_y)
+        self.bullet_x[games] = np.where(can_move, new_x, self.bullet_x[games])
+        self.bullet_y[games] = np.where(can_move, new_y, self.bullet_y[games])
+
+    def _fire_bullets(self, shooting):
+        games = self._games[shooting]
+        if games.size == 0:
+            return
+
+        direction = self.tank_direction[games]
+        self.bullet_alive[games] = True
+        self.bullet_direction[games] = direction
+        self.bullet_x[games] = self.tank_x[games] + enums.BULLET_SHIFT_X[direction]
+        self.bullet_y[games] = self.tank_y[games] + enums.BULLET_SHIFT_Y[direction]
+
+        self._collide_bullets(games, self.bullet_x[games], self.bullet_y[games])
+
+    def _collide_bullets(self, games, new_x, new_y):
+        """
+        Resolves wall and static collisions for bullets of given games moving to new position.
+        Collided bullets are removed and replaced with explosions. Returns mask of bullets which can move.
+        """
+        direction = self.bullet_direction[games]
+        dx = enums.BULLET_RECT_DX[direction]
+        dy = enums.BULLET_RECT_DY[direction]
+
+        in_bounds = self._in_bounds(new_x, new_y, dx, dy)
+        free = self._is_free(games, new_x, new_y, dx, dy, in_bounds)
+        can_move = in_bounds & free
+
+        static_hit = in_bounds & ~free
+        if static_hit.any():
+            self._collide_static(games[static_hit], new_x[static_hit], new_y[static_hit],
+                                 direction[static_hit], dx[static_hit], dy[static_hit])
+
+        collided = games[~can_move]
+        if collided.size:
+            self._explode(collided)
+            self.bullet_alive[collided] = False
+
+        return can_move
+
+    def _collide_static(self, games, x, y, direction, dx, dy):
+        vertical = (direction == enums.DIRECTION_UP) | (direction == enums.DIRECTION_DOWN)
+
+        x_min = np.where(vertical | (direction == enums.DIRECTION_LEFT), x, x + dx) // enums.CELL_SIZE
+        y_min = np.where(~vertical | (direction == enums.DIRECTION_UP), y, y + dy) // enums.CELL_SIZE
+        x_max = np.where(vertical, (x + dx + 3) // enums.CELL_SIZE, x_min + 1)
+        y_max = np.where(vertical, y_min + 1, (y + dy + 3) // enums.CELL_SIZE)
+
+        self._hit_cells(games, x_min, y_min, vertical)
+        self._hit_cells(games, x_max - 1, y_max - 1, vertical)
+
+    def _hit_cells(self, games, x, y, vertical):
+        x = np.clip(x, 0, MAP_SIZE - 1)
+        y = np.clip(y, 0, MAP_SIZE - 1)
+
+        cell = self.maps[games, y, x].astype(np.int32)
+        bricks = static_object_mask(cell, enums.StaticObjectTypes.BRICK)
+        if not bricks.any():
+            return
+
+        games, x, y, vertical = games[bricks], x[bricks], y[bricks], vertical[bricks]
+        phase = (cell[bricks] - 1) % STATIC_SPRITE_TYPE_COUNT
+        self.maps[games, y, x] = 0
+
+        self._clear_cells(games, x - 1, y, vertical & ((phase == 3) | (phase == 1)))
+        self._clear_cells(games, x + 1, y, vertical & ((phase == 2) | (phase == 0)))
+        self._clear_cells(games, x, y - 1, ~vertical & ((phase == 2) | (phase == 3)))
+        self._clear_cells(games, x, y + 1, ~vertical & ((phase == 1) | (phase == 0)))
+
+    def _clear_cells(self, games, x, y, mask):
+        if mask.any():
+            self.maps[games[mask], np.clip(y[mask], 0, MAP_SIZE - 1), np.clip(x[mask], 0, MAP_SIZE - 1)] = 0
+
+    def _explode(self, games):
+        direction = self.bullet_direction[games]
+        slots = np.argmin(self.animation_alive[games], axis=1)
+
+        self.animation_alive[games, slots] = True
+        self.animation_counter[games, slots] = 0
+        self.animation_x[games, slots] = self.bullet_x[games] + enums.EXPLOSION_SHIFT_X[direction]
+        self.animation_y[games, slots] = self.bullet_y[games] + enums.EXPLOSION_SHIFT_Y[direction]
+
+    @staticmethod
+    def _in_bounds(new_x, new_y, dx, dy):
+        return (new_x >= 0) & (new_x <= BOARD_SIZE - dx) & (new_y >= 0) & (new_y <= BOARD_SIZE - dy)
+
+    def _is_free(self, games, new_x, new_y, dx, dy, in_bounds):
+        """
+        Checks that map cells under rectangles are empty. Rectangles are at most TANK_SIZE wide.
+        """
+        window = TANK_SIZE // enums.CELL_SIZE + 1
+        offsets = np.arange(window)
+
+        x_min = new_x // enums.CELL_SIZE
+        y_min = new_y // enums.CELL_SIZE
+        x_count = (new_x + dx + 3) // enums.CELL_SIZE - x_min
+        y_count = (new_y + dy + 3) // enums.CELL_SIZE - y_min
+
+        xs = np.clip(x_min[:, None] + offsets, 0, MAP_SIZE - 1)
+        ys = np.clip(y_min[:, None] + offsets, 0, MAP_SIZE - 1)
+
+        cells = self.maps[games[:, None, None], ys[:, :, None], xs[:, None, :]]
+        mask = (offsets < y_count[:, None])[:, :, None] & (offsets < x_count[:, None])[:, None, :]
+        mask &= in_bounds[:, None, None]
+
+        return ~np.any((cells != 0) & mask, axis=(1, 2))